@@ -1,39 +1,79 @@
-import io
 import uuid
+from datetime import datetime
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Request, Response, UploadFile
 from fastapi.responses import StreamingResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models, schemas
 from app.db import get_session
-from app.services import evaluation, files, pipeline, records
+from app.config import get_settings
+from app.services import evaluation, files, jobs, pipeline, prediction_cache, records, response_cache, rollups
 
 router = APIRouter()
+settings = get_settings()
 
 
 @router.post("/upload_csv", response_model=schemas.UploadResponse, responses={400: {"model": schemas.ErrorResponse}})
 async def upload_csv(file: UploadFile = File(...), session: AsyncSession = Depends(get_session)):
     try:
         batch_id = await files.save_upload(file, session)
-        # Auto-run the pipeline so the batch is ready for export immediately.
         batch_uuid = uuid.UUID(batch_id)
-        await pipeline.process_batch(session, batch_uuid)
-        await pipeline.run_model(session, batch_uuid)
+        if settings.inline_pipeline:
+            await pipeline.process_batch(session, batch_uuid)
+            await pipeline.run_model(session, batch_uuid)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
+    if settings.inline_pipeline:
+        return {
+            "status": "success",
+            "file_id": batch_id,
+            "message": "CSV file uploaded successfully.",
+        }
+    # Cleaning and inference run in `python -m app.worker`; poll /jobs/{job_id}.
+    job = await jobs.enqueue(session, batch_uuid)
     return {
         "status": "success",
         "file_id": batch_id,
-        "message": "CSV file uploaded successfully.",
+        "job_id": str(job.id_job),
+        "message": "CSV file uploaded, processing queued.",
     }
 
 
-@router.get("/records", response_model=schemas.RecordsResponse)
-async def list_records(session: AsyncSession = Depends(get_session)):
-    recs = await records.list_records(session)
-    return {"status": "success", "records": recs}
+@router.get("/jobs/{job_id}", response_model=schemas.JobResponse, responses={404: {"model": schemas.ErrorResponse}})
+async def get_job(job_id: str, session: AsyncSession = Depends(get_session)):
+    try:
+        job_uuid = uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid job_id.")
+    job = await jobs.get_job(session, job_uuid)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return {"status": "success", "job": job, "timings": jobs.timings(job)}
+
+
+@router.get("/records", response_model=schemas.RecordsResponse, responses={400: {"model": schemas.ErrorResponse}})
+async def list_records(
+    file_id: str | None = None,
+    src: str | None = None,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = 100,
+    session: AsyncSession = Depends(get_session),
+):
+    try:
+        batch_uuid = uuid.UUID(file_id) if file_id else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid file_id.")
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive.")
+    try:
+        recs, next_cursor = await records.list_records(session, batch_uuid, src, time_from, time_to, cursor, limit)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"status": "success", "records": recs, "next_cursor": next_cursor}
 
 
 @router.post("/records", response_model=schemas.RecordResponse, responses={400: {"model": schemas.ErrorResponse}})
@@ -55,34 +95,66 @@ async def delete_record(record_id: int, session: AsyncSession = Depends(get_sess
 @router.post("/process_batch", response_model=schemas.BaseResponse, responses={400: {"model": schemas.ErrorResponse}})
 async def process_batch(payload: schemas.BatchActionRequest, session: AsyncSession = Depends(get_session)):
     try:
-        await pipeline.process_batch(session, payload.file_id)
+        await pipeline.process_batch(session, payload.file_id, incremental=payload.incremental)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
     return {"status": "success", "message": "Batch processed."}
 
 
+# Clean and classify only rows appended to the batch (e.g. via POST /records); existing labels and edits stay.
+@router.post("/classify_new", response_model=schemas.BaseResponse, responses={400: {"model": schemas.ErrorResponse}})
+async def classify_new(payload: schemas.BatchActionRequest, session: AsyncSession = Depends(get_session)):
+    try:
+        cleaned = await pipeline.process_batch(session, payload.file_id, incremental=True)
+        classified = await pipeline.run_model(session, payload.file_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"status": "success", "message": f"{cleaned} new rows cleaned, {classified} rows classified."}
+
+
 @router.post("/run_model", response_model=schemas.BaseResponse, responses={400: {"model": schemas.ErrorResponse}})
 async def run_model(payload: schemas.BatchActionRequest, session: AsyncSession = Depends(get_session)):
     try:
-        await pipeline.run_model(session, payload.file_id)
+        await pipeline.run_model(session, payload.file_id, reset=payload.reset)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
     return {"status": "success", "message": "Model run stub completed."}
 
 
-@router.get("/export_csv", responses={200: {"content": {"text/csv": {}}, "description": "CSV file"}, 404: {"model": schemas.ErrorResponse}})
-async def export_csv(file_id: str, session: AsyncSession = Depends(get_session)):
+@router.get("/prediction_cache", response_model=schemas.PredictionCacheStatsResponse)
+async def get_prediction_cache_stats():
+    return {"status": "success", **prediction_cache.get_prediction_cache().stats()}
+
+
+@router.get(
+    "/export_csv",
+    responses={
+        200: {
+            "content": {media_type: {} for media_type, _ in files.EXPORT_FORMATS.values()},
+            "description": "CSV, Parquet or Arrow IPC stream",
+        },
+        404: {"model": schemas.ErrorResponse},
+    },
+)
+async def export_csv(file_id: str, format: str = "csv", session: AsyncSession = Depends(get_session)):
     try:
         batch_uuid = uuid.UUID(file_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid file_id.")
-    data = await files.export_final(batch_uuid, session)
-    if not data:
+    try:
+        files.check_export_format(format)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except RuntimeError as exc:
+        raise HTTPException(status_code=501, detail=str(exc))
+    if not await files.has_export(batch_uuid, session):
         raise HTTPException(status_code=404, detail="Файл не найден или не готов.")
+    media_type, extension = files.EXPORT_FORMATS[format]
+    body = files.iter_export(batch_uuid) if format == "csv" else files.iter_export_columnar(batch_uuid, format)
     return StreamingResponse(
-        io.BytesIO(data),
-        media_type="text/csv",
-        headers={"Content-Disposition": f'attachment; filename=\"{batch_uuid}.csv\"'},
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename=\"{batch_uuid}.{extension}\"'},
     )
 
 
@@ -93,10 +165,16 @@ async def upload_labels(file_id: str, file: UploadFile = File(...), session: Asy
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid file_id.")
     try:
-        score = await evaluation.evaluate_labels(session, batch_uuid, file)
+        metrics = await evaluation.evaluate_labels(session, batch_uuid, file)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
-    return {"status": "success", "file_id": str(batch_uuid), "f1_metric": score, "message": "Labels evaluated."}
+    return {
+        "status": "success",
+        "file_id": str(batch_uuid),
+        "f1_metric": metrics["macro_f1"],
+        "metrics": metrics,
+        "message": "Labels evaluated.",
+    }
 
 
 @router.get("/batch_summary", response_model=schemas.BatchSummaryResponse, responses={404: {"model": schemas.ErrorResponse}})
@@ -122,18 +200,31 @@ async def get_batch_count(file_id: str, session: AsyncSession = Depends(get_sess
 
 
 @router.get("/sentiment_share", response_model=schemas.SentimentShareResponse, responses={400: {"model": schemas.ErrorResponse}})
-async def get_sentiment_share(file_id: str, session: AsyncSession = Depends(get_session)):
+async def get_sentiment_share(
+    file_id: str,
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_session),
+):
     try:
         batch_uuid = uuid.UUID(file_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid file_id.")
-    share = await records.sentiment_share(session, batch_uuid)
-    return {"status": "success", "file_id": str(batch_uuid), "share": share}
+
+    async def load():
+        share = await records.sentiment_share(session, batch_uuid)
+        return {"status": "success", "file_id": str(batch_uuid), "share": share}
+
+    return await response_cache.get_response_cache().respond(
+        request, response, session, "sentiment_share", batch_uuid, (), load
+    )
 
 
 @router.get("/sentiment_series", response_model=schemas.SentimentSeriesResponse, responses={400: {"model": schemas.ErrorResponse}})
 async def get_sentiment_series(
     file_id: str,
+    request: Request,
+    response: Response,
     granularity: str = "day",
     session: AsyncSession = Depends(get_session),
 ):
@@ -142,13 +233,21 @@ async def get_sentiment_series(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid file_id.")
     granularity = granularity if granularity in {"day", "week", "month"} else "day"
-    series = await records.classified_sentiment_timeseries(session, batch_uuid, granularity)
-    return {"status": "success", "file_id": str(batch_uuid), "series": series}
+
+    async def load():
+        series = await records.classified_sentiment_timeseries(session, batch_uuid, granularity)
+        return {"status": "success", "file_id": str(batch_uuid), "series": series}
+
+    return await response_cache.get_response_cache().respond(
+        request, response, session, "sentiment_series", batch_uuid, (granularity,), load
+    )
 
 
 @router.get("/review_series", response_model=schemas.ReviewSeriesResponse, responses={400: {"model": schemas.ErrorResponse}})
 async def get_review_series(
     file_id: str,
+    request: Request,
+    response: Response,
     granularity: str = "day",
     session: AsyncSession = Depends(get_session),
 ):
@@ -157,8 +256,56 @@ async def get_review_series(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid file_id.")
     granularity = granularity if granularity in {"day", "week", "month"} else "day"
-    series = await records.review_timeseries(session, batch_uuid, granularity)
-    return {"status": "success", "file_id": str(batch_uuid), "series": series}
+
+    async def load():
+        series = await records.review_timeseries(session, batch_uuid, granularity)
+        return {"status": "success", "file_id": str(batch_uuid), "series": series}
+
+    return await response_cache.get_response_cache().respond(
+        request, response, session, "review_series", batch_uuid, (granularity,), load
+    )
+
+
+@router.get("/analytics/share", response_model=schemas.SourceShareResponse)
+async def get_source_share(
+    src: str | None = None,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    session: AsyncSession = Depends(get_session),
+):
+    share, total = await records.source_sentiment_share(session, src, time_from, time_to)
+    return {"status": "success", "share": share, "total": total}
+
+
+@router.get("/analytics/series", response_model=schemas.SourceSeriesResponse)
+async def get_source_series(
+    granularity: str = "month",
+    src: str | None = None,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    session: AsyncSession = Depends(get_session),
+):
+    granularity = granularity if granularity in {"day", "week", "month"} else "month"
+    series = await records.source_sentiment_timeseries(session, granularity, src, time_from, time_to)
+    return {"status": "success", "granularity": granularity, "src": src, "series": series}
+
+
+@router.get("/dashboard", response_model=schemas.DashboardResponse, responses={400: {"model": schemas.ErrorResponse}})
+async def get_dashboard(
+    file_id: str,
+    granularity: str = "day",
+    limit: int = 50,
+    session: AsyncSession = Depends(get_session),
+):
+    try:
+        batch_uuid = uuid.UUID(file_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid file_id.")
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive.")
+    granularity = granularity if granularity in {"day", "week", "month"} else "day"
+    snapshot = await records.dashboard_snapshot(session, batch_uuid, granularity, limit)
+    return {"status": "success", "file_id": str(batch_uuid), "granularity": granularity, **snapshot}
 
 
 @router.get(
@@ -168,6 +315,11 @@ async def get_review_series(
 )
 async def get_classified_comments(
     file_id: str,
+    type_comment: int | None = None,
+    src: str | None = None,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    cursor: str | None = None,
     limit: int = 10,
     session: AsyncSession = Depends(get_session),
 ):
@@ -177,16 +329,50 @@ async def get_classified_comments(
         raise HTTPException(status_code=400, detail="Invalid file_id.")
     if limit <= 0:
         raise HTTPException(status_code=400, detail="limit must be positive.")
-    result = await session.execute(
-        select(models.ClassifiedComment)
-        .where(models.ClassifiedComment.id_batch == batch_uuid)
-        .order_by(models.ClassifiedComment.id_comment)
-        .limit(limit)
-    )
-    items = result.scalars().all()
-    if not items:
-        raise HTTPException(status_code=404, detail="No classified comments found for this batch.")
-    return {"status": "success", "items": items}
+    try:
+        items, next_cursor = await records.list_classified(
+            session, batch_uuid, type_comment, src, time_from, time_to, cursor, limit
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if not items and cursor is None:
+        # Filters that match nothing give an empty page; 404 only for a batch without labels.
+        filtered = any(value is not None for value in (type_comment, src, time_from, time_to))
+        if not filtered or not await records.has_classified(session, batch_uuid):
+            raise HTTPException(status_code=404, detail="No classified comments found for this batch.")
+    return {"status": "success", "items": items, "next_cursor": next_cursor}
+
+
+@router.get("/search", response_model=schemas.SearchResponse, responses={400: {"model": schemas.ErrorResponse}})
+async def search_classified(
+    q: str,
+    mode: str = "substring",
+    file_id: str | None = None,
+    type_comment: int | None = None,
+    src: str | None = None,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = 20,
+    session: AsyncSession = Depends(get_session),
+):
+    try:
+        batch_uuid = uuid.UUID(file_id) if file_id else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid file_id.")
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive.")
+    try:
+        hits, next_cursor = await records.search_classified(
+            session, q, mode, batch_uuid, type_comment, src, time_from, time_to, cursor, limit
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    items = [
+        {**schemas.ClassifiedRead.model_validate(item).model_dump(), "highlights": highlights}
+        for item, highlights in hits
+    ]
+    return {"status": "success", "items": items, "next_cursor": next_cursor}
 
 
 @router.put(
@@ -204,18 +390,38 @@ async def update_classified_comment(
             models.ClassifiedComment.id_batch == batch_uuid,
             models.ClassifiedComment.id_comment == payload.id_comment,
         )
+        # The old label feeds the rollup deltas; concurrent relabels must not both read it.
+        .with_for_update()
     )
     item = result.scalar_one_or_none()
     if not item:
         raise HTTPException(status_code=404, detail="Classified comment not found for this batch/id_comment.")
 
+    await rollups.apply(
+        session,
+        batch_uuid,
+        rollups.relabel_deltas([(item.time, item.src, item.type_comment, payload.type_comment)]),
+    )
     item.type_comment = payload.type_comment
+    item.model_version = pipeline.MANUAL_VERSION
+    await response_cache.bump_version(session, batch_uuid)
 
-    # Keep validation table in sync if entry exists
-    val = await session.get(models.ValidationComment, (payload.id_comment, batch_uuid))
-    if val:
-        val.type_comment = payload.type_comment
+    await records.mark_validated(session, batch_uuid, [(payload.id_comment, payload.type_comment)])
 
     await session.commit()
     await session.refresh(item)
     return {"status": "success", "item": item}
+
+
+@router.post(
+    "/classified/bulk",
+    response_model=schemas.BulkRelabelResponse,
+    responses={400: {"model": schemas.ErrorResponse}},
+)
+async def bulk_relabel_classified(
+    payload: schemas.BulkRelabelRequest,
+    session: AsyncSession = Depends(get_session),
+):
+    changes = {item.id_comment: item.type_comment for item in payload.items}
+    updated = await records.relabel_classified(session, payload.file_id, changes.items())
+    return {"status": "success", "file_id": str(payload.file_id), "requested": len(changes), "updated": updated}
@@ -8,10 +8,42 @@ class Settings(BaseSettings):
     upload_dir: str = Field(default="storage/uploads")
     output_dir: str = Field(default="storage/outputs")
     model_api_url: str = Field(default="https://breathlessly-glowing-turnstone.cloudpub.ru")
+    model_max_concurrency: int = Field(default=4)
+    model_timeout: float = Field(default=60.0)
+    # Adaptive chunking: aim for this many seconds per /predict request.
+    model_target_latency: float = Field(default=5.0)
+    model_initial_chunk_size: int = Field(default=1000)
+    model_min_chunk_size: int = Field(default=100)
+    model_max_chunk_size: int = Field(default=5000)
+    model_max_payload_bytes: int = Field(default=2_000_000)
+    # Tag stored with cached predictions; change it when the model is replaced.
+    model_version: str = Field(default="v1")
+    prediction_cache_size: int = Field(default=200_000)
+    # run_model predicts and commits this many rows at a time (its checkpoint granularity).
+    run_model_chunk_size: int = Field(default=10_000)
+    # Cached /sentiment_share and series responses: entries, lifetime, and how long a
+    # batch version read from the database is trusted before it is re-checked.
+    response_cache_size: int = Field(default=1024)
+    response_cache_ttl: float = Field(default=300.0)
+    response_cache_version_ttl: float = Field(default=1.0)
+    # Run cleaning and inference inside POST /upload_csv instead of queueing a job.
+    inline_pipeline: bool = Field(default=False)
+    job_poll_interval: float = Field(default=2.0)
+    job_heartbeat_interval: float = Field(default=15.0)
+    # A running job without a heartbeat for this long is considered abandoned and re-claimed.
+    job_stale_after: float = Field(default=120.0)
+    job_max_attempts: int = Field(default=3)
+    # `python -m app.retention` drops batches whose summary is older than this; 0 keeps everything.
+    retention_days: int = Field(default=0)
+    # Also index to_tsvector('russian', comment_clean) for GET /search?mode=fulltext.
+    search_fulltext_index: bool = Field(default=False)
+    # Names from app.services.cleaning.STEPS, applied in order by process_batch (JSON list in env).
+    cleaning_steps: list[str] = Field(default_factory=list)
 
     class Config:
         env_file = ".env"
         extra = "ignore"
+        protected_namespaces = ("settings_",)
 
 
 @lru_cache
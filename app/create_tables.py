@@ -1,11 +1,129 @@
 import asyncio
 
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app import models  # noqa: F401 - registers the tables on Base.metadata
+from app.config import get_settings
 from app.db import Base, engine
+from app.services import partitions, rollups
+
+settings = get_settings()
+
+# pg_advisory_xact_lock key serializing schema setup between the API and the workers.
+INIT_LOCK_KEY = 0x5E471
+
+# Old full-width shape of validation rows, computed from classified_comments and the
+# slim comment_validation table for readers that still expect it.
+VALIDATION_VIEW = """
+CREATE VIEW validation_comments AS
+SELECT c.id_comment, c.id_batch, c.comment_clean, c.src, c.time, c.type_comment,
+       COALESCE(v.validated, FALSE) AS validation
+FROM classified_comments c
+LEFT JOIN comment_validation v ON v.id_batch = c.id_batch AND v.id_comment = c.id_comment
+"""
+
+
+# Columns added to tables that existed before; create_all does not alter existing tables.
+ADDED_COLUMNS = (
+    ("classified_comments", "model_version", "VARCHAR"),
+    ("batch_summary", "metrics", "JSON"),
+    ("batch_summary", "unique_ratio", "FLOAT NOT NULL DEFAULT 1.0"),
+    ("batch_summary", "dedup_bytes_saved", "BIGINT NOT NULL DEFAULT 0"),
+    ("batch_summary", "classified_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("batch_summary", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("batch_summary", "unique_count", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+# Single-column indexes made redundant by the composite indexes leading with id_batch.
+DROPPED_INDEXES = ("ix_raw_comments_id_batch", "ix_classified_comments_id_batch")
+
+
+async def _column_names(conn: AsyncConnection, table: str) -> set[str]:
+    return await conn.run_sync(lambda sync: {column["name"] for column in inspect(sync).get_columns(table)})
+
+
+async def _upgrade_schema(conn: AsyncConnection) -> None:
+    """Bring tables created by older versions up to the current models."""
+    existing: dict[str, set[str]] = {}
+    for table, column, ddl in ADDED_COLUMNS:
+        if table not in existing:
+            existing[table] = await _column_names(conn, table)
+        if column in existing[table]:
+            continue
+        await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        if (table, column) == ("batch_summary", "classified_count"):
+            await conn.execute(
+                text(
+                    "UPDATE batch_summary SET classified_count = "
+                    "(SELECT count(*) FROM classified_comments c WHERE c.id_batch = batch_summary.id_batch)"
+                )
+            )
+        if (table, column) == ("batch_summary", "unique_count"):
+            await conn.execute(
+                text(
+                    "UPDATE batch_summary SET unique_count = (SELECT count(DISTINCT c.comment_clean) "
+                    "FROM classified_comments c WHERE c.id_batch = batch_summary.id_batch)"
+                )
+            )
+    for index in DROPPED_INDEXES:
+        await conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+    # Indexes declared on existing tables (keyset pagination, time filters).
+    await conn.run_sync(
+        lambda sync: [
+            index.create(sync, checkfirst=True) for table in Base.metadata.sorted_tables for index in table.indexes
+        ]
+    )
+
+
+async def _ensure_validation_view(conn: AsyncConnection) -> None:
+    if conn.dialect.name == "postgresql":
+        kind = await conn.scalar(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('validation_comments')"))
+        is_table, is_view = kind in ("r", "p"), kind == "v"
+    else:
+        kind = await conn.scalar(text("SELECT type FROM sqlite_master WHERE name = 'validation_comments'"))
+        is_table, is_view = kind == "table", kind == "view"
+    if is_table:
+        # The legacy copy duplicated classified_comments; keep it aside until it is dropped by hand.
+        await conn.execute(text("ALTER TABLE validation_comments RENAME TO validation_comments_legacy"))
+    if not is_view:
+        await conn.execute(text(VALIDATION_VIEW))
+
+
+async def _ensure_search_indexes(conn: AsyncConnection) -> None:
+    """GIN indexes behind GET /search (Postgres only; created on existing tables too)."""
+    if conn.dialect.name != "postgresql":
+        return
+    await conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_classified_comments_comment_trgm "
+            "ON classified_comments USING gin (comment_clean gin_trgm_ops)"
+        )
+    )
+    if settings.search_fulltext_index:
+        await conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_classified_comments_comment_fts "
+                "ON classified_comments USING gin (to_tsvector('russian'::regconfig, comment_clean))"
+            )
+        )
 
 
 async def init_models():
     async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Processes starting together would otherwise race on CREATE and fail on duplicates.
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": INIT_LOCK_KEY})
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
+        await _upgrade_schema(conn)
+        await partitions.ensure_defaults(conn)
+        await _ensure_validation_view(conn)
+        await _ensure_search_indexes(conn)
+        if conn.dialect.name == "postgresql":
+            # Day bucketing uses timezone(), which SQLite lacks.
+            await rollups.backfill_batches(conn)
+        await rollups.backfill_sources(conn)
 
 
 if __name__ == "__main__":
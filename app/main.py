@@ -4,7 +4,6 @@ from fastapi.responses import JSONResponse
 
 from app.api.routes import router as api_router
 from app.config import get_settings
-from app.db import Base, engine
 
 settings = get_settings()
 app = FastAPI(title="Comments Pipeline API")
@@ -33,8 +32,16 @@ async def unhandled_exception_handler(_: Request, exc: Exception):
 @app.on_event("startup")
 async def startup_event():
     # Ensure DB schema exists and file storage directories are present.
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    from app.create_tables import init_models
     from app.services.files import _ensure_dirs
 
+    await init_models()
+
     _ensure_dirs()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    from app.services.model_client import close_model_client
+
+    await close_model_client()
@@ -1,17 +1,27 @@
 import uuid
 
-from sqlalchemy import Boolean, Column, DateTime, Float, Integer, String, UniqueConstraint
+from sqlalchemy import JSON, BigInteger, Boolean, Column, Date, DateTime, Float, Index, Integer, String, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 
 from app.db import Base
 
 
+# The comment tables are LIST-partitioned by id_batch on Postgres, one partition per
+# batch (see app/services/partitions.py).
 class RawComment(Base):
     __tablename__ = "raw_comments"
+    # Keyset pages of GET /records walk (id_batch, id_comment), optionally within one src
+    # or time range; these indexes also serve plain id_batch lookups.
+    __table_args__ = (
+        Index("ix_raw_comments_batch_comment", "id_batch", "id_comment"),
+        Index("ix_raw_comments_batch_src_comment", "id_batch", "src", "id_comment"),
+        Index("ix_raw_comments_batch_time_comment", "id_batch", "time", "id_comment"),
+        {"postgresql_partition_by": "LIST (id_batch)"},
+    )
 
     id_comment = Column(Integer, primary_key=True, autoincrement=False)
-    id_batch = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    id_batch = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     comment = Column(String, nullable=False)
     src = Column(String, nullable=True)
     time = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -19,6 +29,7 @@ class RawComment(Base):
 
 class CleanedComment(Base):
     __tablename__ = "cleaned_comments"
+    __table_args__ = {"postgresql_partition_by": "LIST (id_batch)"}
 
     id_comment = Column(Integer, primary_key=True, autoincrement=False)
     id_batch = Column(UUID(as_uuid=True), primary_key=True, index=True)
@@ -29,25 +40,39 @@ class CleanedComment(Base):
 
 class ClassifiedComment(Base):
     __tablename__ = "classified_comments"
+    # Keyset pages of GET /classified, unfiltered or filtered by sentiment, src or time range.
+    __table_args__ = (
+        Index("ix_classified_comments_batch_comment", "id_batch", "id_comment"),
+        Index("ix_classified_comments_batch_type_comment", "id_batch", "type_comment", "id_comment"),
+        Index("ix_classified_comments_batch_src_comment", "id_batch", "src", "id_comment"),
+        Index("ix_classified_comments_batch_time_comment", "id_batch", "time", "id_comment"),
+        {"postgresql_partition_by": "LIST (id_batch)"},
+    )
 
     id_comment = Column(Integer, primary_key=True, autoincrement=False)
-    id_batch = Column(UUID(as_uuid=True), primary_key=True, index=True)
+    id_batch = Column(UUID(as_uuid=True), primary_key=True)
     comment_clean = Column(String, nullable=False)
     src = Column(String, nullable=True)
     time = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     type_comment = Column(Integer, nullable=False, default=0)
+    # Settings.model_version that produced the label; NULL for manual or legacy rows.
+    model_version = Column(String, nullable=True)
+
 
+class CommentValidation(Base):
+    """Manual review state of a classified comment; rows exist only for reviewed comments.
 
-class ValidationComment(Base):
-    __tablename__ = "validation_comments"
+    The old full-width shape is served by the `validation_comments` view (see
+    app/create_tables.py).
+    """
+
+    __tablename__ = "comment_validation"
+    __table_args__ = {"postgresql_partition_by": "LIST (id_batch)"}
 
     id_comment = Column(Integer, primary_key=True, autoincrement=False)
-    id_batch = Column(UUID(as_uuid=True), primary_key=True, index=True)
-    comment_clean = Column(String, nullable=False)
-    src = Column(String, nullable=True)
-    time = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
-    type_comment = Column(Integer, nullable=False, default=0)
-    validation = Column(Boolean, nullable=False, default=False)
+    id_batch = Column(UUID(as_uuid=True), primary_key=True)
+    validated = Column(Boolean, nullable=False, default=True)
+    corrected_label = Column(Integer, nullable=True)
 
 
 class BatchSummary(Base):
@@ -56,3 +81,69 @@ class BatchSummary(Base):
     id_batch = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     time = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     f1_metric = Column(Float, nullable=False, default=0.0)
+    # Per-class precision/recall/F1 and the confusion matrix of the last /upload_labels.
+    metrics = Column(JSON, nullable=True)
+    # Duplicate texts across the batch's classified rows: distinct texts / rows and UTF-8 bytes of
+    # repeats. run_model advances them per chunk; unique_count is the distinct-text counter behind the ratio.
+    unique_count = Column(Integer, nullable=False, default=0)
+    unique_ratio = Column(Float, nullable=False, default=1.0)
+    dedup_bytes_saved = Column(BigInteger, nullable=False, default=0)
+    # Rows in classified_comments for this batch, maintained incrementally by run_model.
+    classified_count = Column(Integer, nullable=False, default=0)
+    # Bumped whenever the batch's labels or metrics change; tags cached responses and ETags.
+    version = Column(Integer, nullable=False, default=0)
+
+
+class SentimentRollup(Base):
+    """Classified row counts per batch, UTC day, sentiment and src ('' when src is NULL)."""
+
+    __tablename__ = "sentiment_rollup"
+
+    id_batch = Column(UUID(as_uuid=True), primary_key=True)
+    day = Column(Date, primary_key=True)
+    type_comment = Column(Integer, primary_key=True)
+    src = Column(String, primary_key=True, default="")
+    count = Column(Integer, nullable=False, default=0)
+
+
+class SourceSentimentRollup(Base):
+    """Classified row counts across all batches per src ('' when NULL), UTC day and sentiment.
+
+    Maintained together with sentiment_rollup by app/services/rollups.py.
+    """
+
+    __tablename__ = "source_sentiment_rollup"
+
+    src = Column(String, primary_key=True, default="")
+    day = Column(Date, primary_key=True)
+    type_comment = Column(Integer, primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id_job = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id_batch = Column(UUID(as_uuid=True), nullable=False, index=True)
+    # queued -> running -> done | failed; `stage` tracks the step inside a running job.
+    status = Column(String, nullable=False, default="queued", index=True)
+    stage = Column(String, nullable=False, default="queued")
+    rows_cleaned = Column(Integer, nullable=False, default=0)
+    rows_classified = Column(Integer, nullable=False, default=0)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    cleaned_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class PredictionCache(Base):
+    __tablename__ = "prediction_cache"
+
+    text_hash = Column(String(64), primary_key=True)
+    model_version = Column(String, primary_key=True)
+    type_comment = Column(Integer, nullable=False)
+    time = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
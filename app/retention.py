@@ -0,0 +1,42 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from app.config import get_settings
+from app.db import AsyncSessionLocal, engine
+from app.services import partitions
+
+settings = get_settings()
+logger = logging.getLogger("app.retention")
+
+
+async def main(days: int, dry_run: bool) -> None:
+    """Drop every batch last updated more than `days` days ago (see `partitions.expired_batches`)."""
+    if days <= 0:
+        logger.info("Retention disabled (RETENTION_DAYS=%s)", days)
+        return
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    try:
+        async with AsyncSessionLocal() as session:
+            batches = await partitions.expired_batches(session, cutoff)
+            logger.info("%s batch(es) older than %s", len(batches), cutoff.isoformat())
+            for batch_id in batches:
+                if dry_run:
+                    logger.info("Would drop batch %s", batch_id)
+                    continue
+                # One transaction per batch keeps the partition locks short.
+                await partitions.drop_batch(session, batch_id)
+                await session.commit()
+                logger.info("Dropped batch %s", batch_id)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Expire old batches by dropping their partitions.")
+    parser.add_argument("--days", type=int, default=settings.retention_days)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.days, args.dry_run))
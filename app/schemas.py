@@ -2,7 +2,7 @@ from datetime import datetime
 from typing import List, Literal
 from uuid import UUID
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class RecordBase(BaseModel):
@@ -29,6 +29,7 @@ class RecordResponse(BaseModel):
 class RecordsResponse(BaseModel):
     status: Literal["success"]
     records: List[RecordRead]
+    next_cursor: str | None = None
 
 
 class BaseResponse(BaseModel):
@@ -39,6 +40,7 @@ class BaseResponse(BaseModel):
 class UploadResponse(BaseModel):
     status: Literal["success"]
     file_id: str
+    job_id: str | None = None
     message: str
 
 
@@ -49,12 +51,35 @@ class ErrorResponse(BaseModel):
 
 class BatchActionRequest(BaseModel):
     file_id: UUID
+    # /run_model: drop existing labels instead of resuming where the last run stopped.
+    reset: bool = False
+    # /process_batch: only clean raw rows that have no cleaned counterpart yet.
+    incremental: bool = False
+
+
+class ClassMetrics(BaseModel):
+    precision: float
+    recall: float
+    f1: float
+    support: int
+
+
+class ConfusionMatrix(BaseModel):
+    labels: list[int]
+    matrix: list[list[int]]
+
+
+class EvaluationMetrics(BaseModel):
+    macro_f1: float
+    per_class: dict[str, ClassMetrics]
+    confusion_matrix: ConfusionMatrix
 
 
 class MetricsResponse(BaseModel):
     status: Literal["success"]
     file_id: str
     f1_metric: float
+    metrics: EvaluationMetrics | None = None
     message: str
 
 
@@ -62,6 +87,10 @@ class BatchSummaryRead(BaseModel):
     id_batch: UUID
     time: datetime | None = None
     f1_metric: float
+    metrics: EvaluationMetrics | None = None
+    unique_ratio: float = 1.0
+    dedup_bytes_saved: int = 0
+    classified_count: int = 0
     model_config = ConfigDict(from_attributes=True)
 
 
@@ -99,6 +128,54 @@ class SentimentSeriesResponse(BaseModel):
     series: dict[str, list[ReviewSeriesItem]]
 
 
+class SourceShareResponse(BaseModel):
+    status: Literal["success"]
+    share: dict[str, dict[str, int]]
+    total: dict[str, int]
+
+
+class SourceSeriesResponse(BaseModel):
+    status: Literal["success"]
+    granularity: str
+    src: str | None = None
+    series: dict[str, list[ReviewSeriesItem]]
+
+
+class PredictionCacheStatsResponse(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
+    status: Literal["success"]
+    model_version: str
+    memory_entries: int
+    memory_hits: int
+    db_hits: int
+    misses: int
+    hit_ratio: float
+
+
+class JobRead(BaseModel):
+    id_job: UUID
+    id_batch: UUID
+    status: str
+    stage: str
+    rows_cleaned: int
+    rows_classified: int
+    attempts: int
+    worker: str | None = None
+    error: str | None = None
+    created_at: datetime | None = None
+    started_at: datetime | None = None
+    cleaned_at: datetime | None = None
+    finished_at: datetime | None = None
+    model_config = ConfigDict(from_attributes=True)
+
+
+class JobResponse(BaseModel):
+    status: Literal["success"]
+    job: JobRead
+    timings: dict[str, float]
+
+
 class ClassifiedRead(BaseModel):
     id_comment: int
     id_batch: UUID
@@ -109,9 +186,33 @@ class ClassifiedRead(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class SearchHit(ClassifiedRead):
+    # [start, end) character offsets of the matches in comment_clean
+    highlights: list[tuple[int, int]]
+
+
+class SearchResponse(BaseModel):
+    status: Literal["success"]
+    items: List[SearchHit]
+    next_cursor: str | None = None
+
+
 class ClassifiedListResponse(BaseModel):
     status: Literal["success"]
     items: List[ClassifiedRead]
+    next_cursor: str | None = None
+
+
+class DashboardResponse(BaseModel):
+    status: Literal["success"]
+    file_id: str
+    granularity: str
+    total: int
+    summary: BatchSummaryRead | None = None
+    share: dict[str, int]
+    series: list[ReviewSeriesItem]
+    sentiment_series: dict[str, list[ReviewSeriesItem]]
+    items: List[ClassifiedRead]
 
 
 class ClassifiedUpdateRequest(BaseModel):
@@ -120,6 +221,23 @@ class ClassifiedUpdateRequest(BaseModel):
     type_comment: int
 
 
+class RelabelItem(BaseModel):
+    id_comment: int
+    type_comment: int
+
+
+class BulkRelabelRequest(BaseModel):
+    file_id: UUID
+    items: List[RelabelItem] = Field(min_length=1, max_length=50_000)
+
+
+class BulkRelabelResponse(BaseModel):
+    status: Literal["success"]
+    file_id: str
+    requested: int
+    updated: int
+
+
 class ClassifiedResponse(BaseModel):
     status: Literal["success"]
     item: ClassifiedRead
@@ -0,0 +1,62 @@
+from itertools import islice
+from typing import Any, Iterable, Sequence
+
+from sqlalchemy import Table, insert
+from sqlalchemy.dialects.postgresql import Insert, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+INSERT_BATCH_SIZE = 5000
+
+
+def _chunks(rows: Iterable[Sequence[Any]], size: int) -> Iterable[list[Sequence[Any]]]:
+    it = iter(rows)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+async def copy_rows(
+    session: AsyncSession,
+    table: Table,
+    columns: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+) -> int:
+    """Write row tuples into `table` inside the session's transaction.
+
+    On asyncpg this streams the tuples with binary COPY
+    (`copy_records_to_table`); other drivers get batched executemany INSERTs.
+    Tuples must follow the order of `columns`. Returns the number of rows written.
+    """
+    conn = await session.connection()
+    if conn.dialect.driver == "asyncpg":
+        raw = await conn.get_raw_connection()
+        driver = raw.driver_connection
+        if not driver.is_in_transaction():
+            # The asyncpg adapter opens its transaction lazily on the first statement;
+            # make sure COPY does not run in autocommit outside of it.
+            await conn.exec_driver_sql("SELECT 1")
+        written = 0
+        for chunk in _chunks(rows, INSERT_BATCH_SIZE):
+            await driver.copy_records_to_table(
+                table.name,
+                records=chunk,
+                columns=list(columns),
+                schema_name=table.schema,
+            )
+            written += len(chunk)
+        return written
+
+    written = 0
+    stmt = insert(table)
+    for chunk in _chunks(rows, INSERT_BATCH_SIZE):
+        await session.execute(stmt, [dict(zip(columns, row)) for row in chunk])
+        written += len(chunk)
+    return written
+
+
+async def upsert_insert(session: AsyncSession, table: Table) -> Insert:
+    """Dialect `INSERT` that supports `on_conflict_do_*` (Postgres, or SQLite for local runs)."""
+    conn = await session.connection()
+    if conn.dialect.name == "sqlite":
+        return sqlite_insert(table)
+    return pg_insert(table)
@@ -0,0 +1,42 @@
+from typing import Callable, Sequence
+
+from sqlalchemy import func
+from sqlalchemy.sql.elements import ColumnElement
+
+# A cleaning step wraps a SQL text expression into another one, so the whole
+# chain is evaluated by the database inside INSERT ... SELECT.
+CleaningStep = Callable[[ColumnElement], ColumnElement]
+
+
+def _trim(expr: ColumnElement) -> ColumnElement:
+    return func.btrim(expr)
+
+
+def _collapse_whitespace(expr: ColumnElement) -> ColumnElement:
+    return func.regexp_replace(expr, r"\s+", " ", "g")
+
+
+def _lowercase(expr: ColumnElement) -> ColumnElement:
+    return func.lower(expr)
+
+
+STEPS: dict[str, CleaningStep] = {
+    "trim": _trim,
+    "collapse_whitespace": _collapse_whitespace,
+    "lowercase": _lowercase,
+}
+
+
+def register_step(name: str, step: CleaningStep) -> None:
+    """Make an additional SQL-expressible step available by name."""
+    STEPS[name] = step
+
+
+def build_expression(expr: ColumnElement, steps: Sequence[str]) -> ColumnElement:
+    """Apply the named steps to `expr` in order; an empty list is a plain copy."""
+    for name in steps:
+        step = STEPS.get(name)
+        if step is None:
+            raise ValueError(f"Unknown cleaning step: {name}. Available: {', '.join(sorted(STEPS))}.")
+        expr = step(expr)
+    return expr
@@ -1,13 +1,14 @@
 import csv
 import io
 import uuid
-from typing import Iterable
 
+import numpy as np
 from fastapi import UploadFile
-from sqlalchemy import select
+from sqlalchemy import Column, Integer, MetaData, Table, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models
+from app.services import bulk, response_cache
 
 
 def _decode_payload(payload: bytes) -> str:
@@ -33,24 +34,63 @@ def _parse_int(val: str | None) -> int:
         raise ValueError(f"Expected integer, got '{val}'.") from exc
 
 
-def _macro_f1(y_true: Iterable[int], y_pred: Iterable[int]) -> float:
-    pairs = list(zip(y_true, y_pred))
-    if not pairs:
-        return 0.0
-    classes = sorted(set(y_true) | set(y_pred))
-    f1_total = 0.0
-    for cls in classes:
-        tp = sum(1 for t, p in pairs if t == cls and p == cls)
-        fp = sum(1 for t, p in pairs if t != cls and p == cls)
-        fn = sum(1 for t, p in pairs if t == cls and p != cls)
-        prec = tp / (tp + fp) if (tp + fp) else 0.0
-        rec = tp / (tp + fn) if (tp + fn) else 0.0
-        f1 = 0.0 if (prec + rec) == 0 else 2 * prec * rec / (prec + rec)
-        f1_total += f1
-    return f1_total / len(classes)
-
-
-async def evaluate_labels(session: AsyncSession, batch_id: uuid.UUID, file: UploadFile) -> float:
+# Gold labels of one /upload_labels request; dropped before the transaction ends.
+_GOLD = Table(
+    "gold_labels",
+    MetaData(),
+    Column("id_comment", Integer, primary_key=True),
+    Column("label", Integer, nullable=False),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+
+def _confusion_metrics(labels: list[int], matrix: np.ndarray) -> dict:
+    """Macro F1 and per-class precision/recall/F1 from a confusion matrix (rows: gold, columns: predicted)."""
+    tp = np.diag(matrix).astype(float)
+    predicted = matrix.sum(axis=0)
+    actual = matrix.sum(axis=1)
+    precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+    recall = np.divide(tp, actual, out=np.zeros_like(tp), where=actual > 0)
+    denom = precision + recall
+    f1 = np.divide(2 * precision * recall, denom, out=np.zeros_like(tp), where=denom > 0)
+    return {
+        "macro_f1": float(f1.mean()) if len(labels) else 0.0,
+        "per_class": {
+            str(label): {
+                "precision": float(precision[idx]),
+                "recall": float(recall[idx]),
+                "f1": float(f1[idx]),
+                "support": int(actual[idx]),
+            }
+            for idx, label in enumerate(labels)
+        },
+        "confusion_matrix": {"labels": labels, "matrix": matrix.tolist()},
+    }
+
+
+async def _confusion_counts(
+    session: AsyncSession, batch_id: uuid.UUID, gold: dict[int, int]
+) -> list[tuple[int, int, int]]:
+    """(gold label, predicted label, rows) for ids present in both the gold set and the batch."""
+    conn = await session.connection()
+    await conn.run_sync(lambda sync_conn: _GOLD.create(sync_conn))
+    await bulk.copy_rows(session, _GOLD, ("id_comment", "label"), gold.items())
+    classified = models.ClassifiedComment
+    result = await session.execute(
+        select(_GOLD.c.label, classified.type_comment, func.count())
+        .join(
+            classified,
+            (classified.id_comment == _GOLD.c.id_comment) & (classified.id_batch == batch_id),
+        )
+        .group_by(_GOLD.c.label, classified.type_comment)
+    )
+    counts = [(int(true), int(pred), int(rows)) for true, pred, rows in result.all()]
+    await conn.run_sync(lambda sync_conn: _GOLD.drop(sync_conn))
+    return counts
+
+
+async def evaluate_labels(session: AsyncSession, batch_id: uuid.UUID, file: UploadFile) -> dict:
     payload = await file.read()
     text = _decode_payload(payload)
     reader = csv.DictReader(io.StringIO(text))
@@ -69,26 +109,26 @@ async def evaluate_labels(session: AsyncSession, batch_id: uuid.UUID, file: Uplo
     if not labels:
         raise ValueError("CSV must contain columns ID and label with integer values.")
 
-    result = await session.execute(select(models.ClassifiedComment).where(models.ClassifiedComment.id_batch == batch_id))
-    preds = {item.id_comment: item.type_comment for item in result.scalars().all()}
-
-    aligned_true = []
-    aligned_pred = []
-    for id_comment, true_label in labels.items():
-        if id_comment in preds:
-            aligned_true.append(true_label)
-            aligned_pred.append(preds[id_comment])
-
-    if not aligned_true:
+    counts = await _confusion_counts(session, batch_id, labels)
+    if not counts:
+        await session.rollback()
         raise ValueError("No overlapping IDs between uploaded labels and classified comments for this batch.")
 
-    score = _macro_f1(aligned_true, aligned_pred)
+    classes = sorted({true for true, _, _ in counts} | {pred for _, pred, _ in counts})
+    index = {label: idx for idx, label in enumerate(classes)}
+    matrix = np.zeros((len(classes), len(classes)), dtype=np.int64)
+    for true, pred, rows in counts:
+        matrix[index[true], index[pred]] += rows
+    metrics = _confusion_metrics(classes, matrix)
+    score = metrics["macro_f1"]
 
     summary = await session.get(models.BatchSummary, batch_id)
     if summary:
         summary.f1_metric = score
+        summary.metrics = metrics
     else:
-        session.add(models.BatchSummary(id_batch=batch_id, f1_metric=score))
+        session.add(models.BatchSummary(id_batch=batch_id, f1_metric=score, metrics=metrics))
+    await response_cache.bump_version(session, batch_id)
 
     await session.commit()
-    return score
+    return metrics
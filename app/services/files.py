@@ -1,3 +1,4 @@
+import codecs
 import csv
 import io
 import os
@@ -5,7 +6,7 @@ import random
 import re
 import uuid
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 from fastapi import UploadFile
 from sqlalchemy import select
@@ -13,9 +14,17 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models
 from app.config import get_settings
+from app.db import AsyncSessionLocal
+from app.services import bulk, partitions
 
 settings = get_settings()
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+ENCODING_PROBE_SIZE = 64 * 1024
+RAW_COLUMNS = ("id_comment", "id_batch", "comment", "src", "time")
+# Rows fetched from the export cursor and encoded per response chunk.
+EXPORT_BATCH_ROWS = 5000
+
 
 def _ensure_dirs() -> None:
     os.makedirs(settings.upload_dir, exist_ok=True)
@@ -60,110 +69,372 @@ def _get_first(row: dict[str, str | None], keys: tuple[str, ...]) -> str | None:
     return None
 
 
-def _repair_csv_text(text: str) -> str:
-    """Merge rows where quoted fields were split across physical lines."""
-    lines = text.splitlines()
-    merged: list[str] = []
-    buffer: list[str] = []
-    def quote_count(chunks: list[str]) -> int:
-        return sum(chunk.count('"') for chunk in chunks)
-    for line in lines:
-        buffer.append(line)
-        if quote_count(buffer) % 2 == 0:
-            merged.append("\n".join(buffer))
-            buffer = []
-    if buffer:
-        merged.append("\n".join(buffer))
-    return "\n".join(merged)
+class _CsvRecordSplitter:
+    """Incrementally merge physical lines into CSV records with balanced quotes.
 
+    Streaming counterpart of the old whole-text repair: lines are buffered until
+    the number of double quotes is even, so quoted fields that were split across
+    physical lines end up in a single record.
+    """
 
-async def save_upload(file: UploadFile, session: AsyncSession) -> str:
-    _ensure_dirs()
-    payload = await file.read()
-    # Try UTF-8 first; fall back to cp1251 for common Russian datasets.
+    def __init__(self) -> None:
+        self._pending = ""
+        self._buffer: list[str] = []
+        self._quotes = 0
+
+    def _push_line(self, line: str, out: list[str]) -> None:
+        self._buffer.append(line)
+        self._quotes += line.count('"')
+        if self._quotes % 2 == 0:
+            out.append("\n".join(self._buffer))
+            self._buffer = []
+            self._quotes = 0
+
+    def feed(self, text: str) -> list[str]:
+        records: list[str] = []
+        lines = (self._pending + text).splitlines(keepends=True)
+        self._pending = ""
+        # Hold back an unterminated tail (or a "\r" that may precede "\n") for the next chunk.
+        if lines and (lines[-1].splitlines()[0] == lines[-1] or lines[-1].endswith("\r")):
+            self._pending = lines.pop()
+        for line in lines:
+            self._push_line(line.splitlines()[0], records)
+        return records
+
+    def close(self) -> list[str]:
+        records: list[str] = []
+        if self._pending:
+            for line in self._pending.splitlines() or [""]:
+                self._push_line(line, records)
+            self._pending = ""
+        if self._buffer:
+            records.append("\n".join(self._buffer))
+            self._buffer = []
+            self._quotes = 0
+        return records
+
+
+class _CsvRowParser:
+    """Parse records from `_CsvRecordSplitter` the way a reader over the whole file would.
+
+    A stray quote inside an unquoted field (`1,5" screen`) unbalances the quote
+    count, so a record can hold several rows or end inside a quoted field. Each
+    record is re-split through a file object; one that ends inside a quoted field
+    is carried over and parsed together with the next. Errors become ValueError.
+    """
+
+    # Appended as an extra line: it comes back as a row of its own only if the
+    # text before it did not end inside a quoted field.
+    _PROBE = "\x1f"
+
+    def __init__(self) -> None:
+        self._carry = ""
+
+    @staticmethod
+    def _parse(text: str) -> list[list[str]]:
+        try:
+            return list(csv.reader(io.StringIO(text)))
+        except csv.Error as exc:
+            raise ValueError(f"Malformed CSV: {exc}") from exc
+
+    def feed(self, records: list[str]) -> list[list[str]]:
+        rows: list[list[str]] = []
+        for record in records:
+            text = f"{self._carry}\n{record}" if self._carry else record
+            parsed = self._parse(f"{text}\n{self._PROBE}")
+            if parsed and parsed[-1] == [self._PROBE]:
+                rows.extend(parsed[:-1])
+                self._carry = ""
+            else:
+                self._carry = text
+        return rows
+
+    def close(self) -> list[list[str]]:
+        text, self._carry = self._carry, ""
+        return self._parse(text) if text else []
+
+
+def _detect_encoding(prefix: bytes) -> str:
+    """Pick utf-8 or cp1251 by probing the first bytes of the upload."""
     try:
-        text = payload.decode("utf-8")
+        # Not final: a multibyte sequence may be cut at the end of the probe.
+        codecs.getincrementaldecoder("utf-8")().decode(prefix, final=False)
+        return "utf-8"
     except UnicodeDecodeError:
-        try:
-            text = payload.decode("cp1251")
-        except UnicodeDecodeError as exc:
-            raise ValueError(f"CSV must be utf-8 or cp1251: {exc}") from exc
+        pass
+    try:
+        prefix.decode("cp1251")
+        return "cp1251"
+    except UnicodeDecodeError as exc:
+        raise ValueError(f"CSV must be utf-8 or cp1251: {exc}") from exc
+
+
+async def _iter_upload_text(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[str]:
+    """Read the upload in chunks and decode it incrementally."""
+    chunk = await file.read(max(chunk_size, ENCODING_PROBE_SIZE))
+    decoder = codecs.getincrementaldecoder(_detect_encoding(chunk[:ENCODING_PROBE_SIZE]))()
+    try:
+        while chunk:
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+            chunk = await file.read(chunk_size)
+        tail = decoder.decode(b"", final=True)
+    except UnicodeDecodeError as exc:
+        raise ValueError(f"CSV must be utf-8 or cp1251: {exc}") from exc
+    if tail:
+        yield tail
 
-    path = os.path.join(settings.upload_dir, "latest_upload.csv")
-    with open(path, "w", encoding="utf-8", newline="") as fp:
-        fp.write(text)
 
-    repaired_text = _repair_csv_text(text)
-    reader = csv.DictReader(io.StringIO(repaired_text))
+def _row_to_dict(header: list[str], values: list[str]) -> dict[str, str | None]:
+    """Map a parsed CSV row onto the header the same way csv.DictReader does."""
+    row: dict[str, str | None] = dict(zip(header, values))
+    if len(values) > len(header):
+        row[None] = values[len(header):]  # type: ignore[index]
+    elif len(values) < len(header):
+        for key in header[len(values):]:
+            row[key] = None
+    return row
+
+
+def _build_raw_row(nrow: dict[str, str | None], batch_uuid: uuid.UUID) -> tuple | None:
+    if not any(val not in (None, "") for val in nrow.values()):
+        return None  # skip fully empty rows
+
+    raw_id = _get_first(nrow, ("id", "id_message", "idmessage", "id_comment", "idcomment"))
+    if raw_id is None:
+        raise ValueError("CSV must contain ID column for id_message.")
+    raw_id_clean = raw_id.strip()
+    if "," in raw_id_clean:
+        raw_id_clean = raw_id_clean.split(",", 1)[0]
+    raw_id_clean = raw_id_clean.strip('"').strip()
+    if not raw_id_clean:
+        # as a fallback, search for the first integer anywhere in the string
+        match = re.search(r"-?\d+", raw_id)
+        if not match:
+            raise ValueError(f"ID must be integer: {raw_id}")
+        raw_id_clean = match.group()
+    try:
+        id_comment = int(raw_id_clean)
+    except ValueError as exc:
+        raise ValueError(f"ID must be integer: {raw_id}") from exc
+
+    comment = _get_first(nrow, ("comment", "comment_clean", "text"))
+    if not comment:
+        return None
+    src = _get_first(nrow, ("src",))
+    time_val = _parse_time(_get_first(nrow, ("time",)))
+    return (id_comment, batch_uuid, comment, src, time_val)
+
+
+async def save_upload(file: UploadFile, session: AsyncSession) -> str:
+    """Stream the upload into raw_comments with memory bounded by the chunk and batch sizes."""
+    _ensure_dirs()
     batch_uuid = uuid.uuid4()
-    rows = []
-    for row in reader:
-        nrow = _normalize_row(row)
-        if not any(val not in (None, "") for val in nrow.values()):
-            continue  # skip fully empty rows
-
-        raw_id = _get_first(nrow, ("id", "id_message", "idmessage", "id_comment", "idcomment"))
-        if raw_id is None:
-            raise ValueError("CSV must contain ID column for id_message.")
-        raw_id_clean = raw_id.strip()
-        if "," in raw_id_clean:
-            raw_id_clean = raw_id_clean.split(",", 1)[0]
-        raw_id_clean = raw_id_clean.strip('"').strip()
-        if not raw_id_clean:
-            # as a fallback, search for the first integer anywhere in the string
-            match = re.search(r"-?\d+", raw_id)
-            if not match:
-                raise ValueError(f"ID must be integer: {raw_id}")
-            raw_id_clean = match.group()
-        try:
-            id_comment = int(raw_id_clean)
-        except ValueError as exc:
-            raise ValueError(f"ID must be integer: {raw_id}") from exc
-
-        comment = _get_first(nrow, ("comment", "comment_clean", "text"))
-        if not comment:
-            continue
-        src = _get_first(nrow, ("src",))
-        time_val = _parse_time(_get_first(nrow, ("time",)))
-        rows.append(
-            models.RawComment(
-                id_comment=id_comment,
-                id_batch=batch_uuid,
-                comment=comment,
-                src=src,
-                time=time_val,
-            )
-        )
+    splitter = _CsvRecordSplitter()
+    parser = _CsvRowParser()
+    header: list[str] | None = None
+    pending: list[tuple] = []
+    total = 0
+
+    async def flush() -> None:
+        nonlocal total
+        if pending:
+            total += await bulk.copy_rows(session, models.RawComment.__table__, RAW_COLUMNS, pending)
+            pending.clear()
+
+    async def consume(rows: list[list[str]]) -> None:
+        nonlocal header
+        for values in rows:
+            if not values:
+                continue
+            if header is None:
+                header = values
+                continue
+            row = _build_raw_row(_normalize_row(_row_to_dict(header, values)), batch_uuid)
+            if row is None:
+                continue
+            pending.append(row)
+            if len(pending) >= bulk.INSERT_BATCH_SIZE:
+                await flush()
 
-    if not rows:
+    path = os.path.join(settings.upload_dir, "latest_upload.csv")
+    # Committed up front: the partitions must not stay locked while the file streams in.
+    await partitions.ensure_batch(batch_uuid)
+    try:
+        with open(path, "w", encoding="utf-8", newline="") as fp:
+            async for text in _iter_upload_text(file):
+                fp.write(text)
+                await consume(parser.feed(splitter.feed(text)))
+        await consume(parser.feed(splitter.close()) + parser.close())
+        await flush()
+    except Exception:
+        await session.rollback()
+        await partitions.discard_batch(batch_uuid)
+        raise
+
+    if not total:
+        await session.rollback()
+        await partitions.discard_batch(batch_uuid)
         raise ValueError("CSV is empty or missing 'comment' column.")
 
-    session.add_all(rows)
     await session.commit()
     return str(batch_uuid)
 
 
-async def export_final(batch_id: uuid.UUID, session: AsyncSession) -> bytes | None:
-    result = await session.execute(
-        select(models.ClassifiedComment).where(models.ClassifiedComment.id_batch == batch_id)
+async def has_export(batch_id: uuid.UUID, session: AsyncSession) -> bool:
+    found = await session.scalar(
+        select(models.ClassifiedComment.id_comment).where(models.ClassifiedComment.id_batch == batch_id).limit(1)
     )
-    records = result.scalars().all()
-    if not records:
-        return None
+    return found is not None
+
+
+_EXPORT_HEADER = ("id_comment", "id_batch", "comment_clean", "src", "time", "type_comment")
+# media type and file extension per export format
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+# Columnar exports fetch bigger partitions: each one becomes a Parquet row group / Arrow record batch.
+COLUMNAR_BATCH_ROWS = 65_536
+PARQUET_COMPRESSION = "zstd"
 
+
+async def _export_partitions(batch_id: uuid.UUID, batch_rows: int) -> AsyncIterator[list[tuple]]:
+    """Classified rows of a batch as lists of `_EXPORT_HEADER` tuples, read from a server-side cursor.
+
+    Opens its own session: the request session is closed before a streaming
+    response body is sent.
+    """
+    classified = models.ClassifiedComment
+    stmt = (
+        select(
+            classified.id_comment,
+            classified.id_batch,
+            classified.comment_clean,
+            classified.src,
+            classified.time,
+            classified.type_comment,
+        )
+        .where(classified.id_batch == batch_id)
+        .order_by(classified.id_comment)
+        .execution_options(yield_per=batch_rows)
+    )
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(stmt)
+        async for partition in result.partitions():
+            yield partition
+
+
+async def iter_export(batch_id: uuid.UUID) -> AsyncIterator[bytes]:
+    """Yield the classified rows of a batch as UTF-8 CSV, one chunk per fetched partition."""
     buf = io.StringIO()
     writer = csv.writer(buf, lineterminator="\n")
-    writer.writerow(["id_comment", "id_batch", "comment_clean", "src", "time", "type_comment"])
-    for item in records:
-        writer.writerow(
-            [
-                item.id_comment,
-                str(item.id_batch),
-                item.comment_clean,
-                item.src or "",
-                item.time.isoformat() if item.time else "",
-                item.type_comment,
-            ]
+    # BOM so Excel on Windows opens UTF-8 correctly.
+    buf.write("\ufeff")
+    writer.writerow(_EXPORT_HEADER)
+    yield buf.getvalue().encode("utf-8")
+
+    async for partition in _export_partitions(batch_id, EXPORT_BATCH_ROWS):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(
+            (
+                id_comment,
+                str(id_batch),
+                comment_clean,
+                src or "",
+                time.isoformat() if time else "",
+                type_comment,
+            )
+            for id_comment, id_batch, comment_clean, src, time, type_comment in partition
         )
-    # Prepend BOM so Excel on Windows opens UTF-8 correctly.
-    return ("\ufeff" + buf.getvalue()).encode("utf-8-sig")
+        yield buf.getvalue().encode("utf-8")
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError("Parquet and Arrow exports require the pyarrow package.") from exc
+    return pyarrow
+
+
+def check_export_format(fmt: str) -> None:
+    """Raise ValueError for an unknown format and RuntimeError if its writer is unavailable."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Available: {', '.join(EXPORT_FORMATS)}.")
+    if fmt != "csv":
+        _import_pyarrow()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that collects what the Arrow writers emit until it is drained."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def iter_export_columnar(batch_id: uuid.UUID, fmt: str) -> AsyncIterator[bytes]:
+    """Yield the classified rows of a batch as a Parquet file or an Arrow IPC stream.
+
+    Each fetched partition becomes one record batch (a row group in Parquet)
+    and is sent as soon as it is written.
+    """
+    pa = _import_pyarrow()
+    schema = pa.schema(
+        [
+            pa.field("id_comment", pa.int64(), nullable=False),
+            pa.field("id_batch", pa.uuid(), nullable=False),
+            pa.field("comment_clean", pa.string(), nullable=False),
+            pa.field("src", pa.string()),
+            pa.field("time", pa.timestamp("us", tz="UTC")),
+            pa.field("type_comment", pa.int16(), nullable=False),
+        ]
+    )
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pa.parquet.ParquetWriter(sink, schema, compression=PARQUET_COMPRESSION)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    try:
+        async for partition in _export_partitions(batch_id, COLUMNAR_BATCH_ROWS):
+            id_comment, id_batch, comment_clean, src, time, type_comment = zip(*partition)
+            batch = pa.record_batch(
+                [
+                    pa.array(id_comment, pa.int64()),
+                    pa.ExtensionArray.from_storage(pa.uuid(), pa.array([value.bytes for value in id_batch], pa.binary(16))),
+                    pa.array(comment_clean, pa.string()),
+                    pa.array(src, pa.string()),
+                    pa.array(time, pa.timestamp("us", tz="UTC")),
+                    pa.array(type_comment, pa.int16()),
+                ],
+                schema=schema,
+            )
+            writer.write_batch(batch)
+            yield sink.drain()
+    finally:
+        writer.close()
+    # Parquet footer / Arrow end-of-stream marker.
+    yield sink.drain()
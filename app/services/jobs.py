@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.config import get_settings
+from app.db import AsyncSessionLocal
+from app.services import pipeline
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+async def enqueue(session: AsyncSession, batch_id: uuid.UUID) -> models.Job:
+    job = models.Job(id_batch=batch_id, status="queued", stage="queued")
+    session.add(job)
+    await session.commit()
+    await session.refresh(job)
+    return job
+
+
+async def get_job(session: AsyncSession, job_id: uuid.UUID) -> models.Job | None:
+    return await session.get(models.Job, job_id)
+
+
+def timings(job: models.Job) -> dict[str, float]:
+    """Seconds spent queued, cleaning and classifying (only for stages that started)."""
+    now = datetime.now(timezone.utc)
+    spans = {
+        "queued": (job.created_at, job.started_at or now),
+        "cleaning": (job.started_at, job.cleaned_at or (now if job.status == "running" else None)),
+        "classifying": (job.cleaned_at, job.finished_at or (now if job.status == "running" else None)),
+    }
+    return {
+        name: (end - start).total_seconds()
+        for name, (start, end) in spans.items()
+        if start is not None and end is not None
+    }
+
+
+async def claim(session: AsyncSession, worker: str) -> models.Job | None:
+    """Lock the oldest runnable job with SKIP LOCKED and mark it running.
+
+    Jobs whose worker stopped sending heartbeats are picked up again until
+    they run out of attempts; then they are marked failed (a batch that keeps
+    killing its worker is not retried forever).
+    """
+    now = datetime.now(timezone.utc)
+    stale_before = now - timedelta(seconds=settings.job_stale_after)
+    stale = (models.Job.status == "running") & (models.Job.heartbeat_at < stale_before)
+    await session.execute(
+        update(models.Job)
+        .where(stale, models.Job.attempts >= settings.job_max_attempts)
+        .values(status="failed", error="Worker stopped responding.", finished_at=now)
+    )
+    result = await session.execute(
+        select(models.Job)
+        .where(
+            or_(
+                models.Job.status == "queued",
+                stale & (models.Job.attempts < settings.job_max_attempts),
+            )
+        )
+        .order_by(models.Job.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    job = result.scalar_one_or_none()
+    if job is None:
+        await session.rollback()
+        return None
+    job.status = "running"
+    job.attempts += 1
+    job.worker = worker
+    job.error = None
+    job.started_at = now
+    job.cleaned_at = None
+    job.finished_at = None
+    job.heartbeat_at = now
+    await session.commit()
+    return job
+
+
+class JobLost(Exception):
+    """The job row was re-claimed by another worker (or attempt) while this one ran it."""
+
+
+async def _update(job: models.Job, **values) -> bool:
+    """Update the job row only while this worker's attempt still owns it."""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(models.Job)
+            .where(
+                models.Job.id_job == job.id_job,
+                models.Job.worker == job.worker,
+                models.Job.attempts == job.attempts,
+            )
+            .values(**values)
+        )
+        await session.commit()
+    return bool(result.rowcount)
+
+
+async def _update_owned(job: models.Job, **values) -> None:
+    if not await _update(job, **values):
+        raise JobLost(job.id_job)
+
+
+async def _heartbeat(job: models.Job, work: asyncio.Task, lost: asyncio.Event) -> None:
+    while True:
+        await asyncio.sleep(settings.job_heartbeat_interval)
+        try:
+            owned = await _update(job, heartbeat_at=datetime.now(timezone.utc))
+        except Exception:
+            # A transient DB error must not end the heartbeat; the next beat retries.
+            logger.exception("Heartbeat of job %s failed", job.id_job)
+            continue
+        if not owned:
+            lost.set()
+            work.cancel()
+            return
+
+
+async def run(job: models.Job) -> None:
+    """Run cleaning and inference for a claimed job, recording progress on the job row.
+
+    Every write is guarded by (worker, attempts); once another worker has
+    re-claimed the job, this run stops and leaves the row alone.
+    """
+    lost = asyncio.Event()
+    work = asyncio.current_task()
+    heartbeat = asyncio.create_task(_heartbeat(job, work, lost))
+    try:
+        async with AsyncSessionLocal() as session:
+            await _update_owned(job, stage="cleaning")
+            cleaned = await pipeline.process_batch(session, job.id_batch)
+            await _update_owned(job, stage="classifying", rows_cleaned=cleaned, cleaned_at=datetime.now(timezone.utc))
+            await pipeline.run_model(
+                session,
+                job.id_batch,
+                on_progress=lambda done: _update_owned(job, rows_classified=done),
+            )
+        await _update_owned(job, status="done", stage="done", finished_at=datetime.now(timezone.utc))
+    except asyncio.CancelledError:
+        if not lost.is_set():
+            raise
+        work.uncancel()
+        logger.warning("Job %s was re-claimed by another worker; attempt %s stopped", job.id_job, job.attempts)
+    except JobLost:
+        logger.warning("Job %s was re-claimed by another worker; attempt %s stopped", job.id_job, job.attempts)
+    except Exception as exc:
+        logger.exception("Job %s failed on attempt %s", job.id_job, job.attempts)
+        retry = job.attempts < settings.job_max_attempts
+        await _update(
+            job,
+            status="queued" if retry else "failed",
+            error=str(exc),
+            finished_at=None if retry else datetime.now(timezone.utc),
+        )
+    finally:
+        heartbeat.cancel()
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import time
+from typing import Sequence
+
+import httpx
+
+from app.config import get_settings
+
+settings = get_settings()
+
+# Weight of the newest observation in the moving throughput estimate.
+_EWMA_ALPHA = 0.3
+# Approximate JSON overhead per text: quotes and separator.
+_TEXT_OVERHEAD_BYTES = 3
+
+
+class ModelClient:
+    """Long-lived client for the model service.
+
+    Keeps one pooled `httpx.AsyncClient`, sends up to `max_concurrency` chunks
+    at once and sizes each chunk so that a request takes roughly
+    `target_latency` seconds without exceeding `max_payload_bytes`.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        max_concurrency: int = 4,
+        timeout: float = 60.0,
+        target_latency: float = 5.0,
+        initial_chunk_size: int = 1000,
+        min_chunk_size: int = 100,
+        max_chunk_size: int = 5000,
+        max_payload_bytes: int = 2_000_000,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.target_latency = target_latency
+        self.min_chunk_size = max(1, min_chunk_size)
+        self.max_chunk_size = max(self.min_chunk_size, max_chunk_size)
+        self.max_payload_bytes = max_payload_bytes
+        self._chunk_size = min(max(initial_chunk_size, self.min_chunk_size), self.max_chunk_size)
+        self._rows_per_second: float | None = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            timeout=timeout,
+            follow_redirects=True,
+            http2=False,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+        )
+
+    @property
+    def chunk_size(self) -> int:
+        return self._chunk_size
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def _observe(self, rows: int, elapsed: float) -> None:
+        if elapsed <= 0:
+            return
+        rate = rows / elapsed
+        if self._rows_per_second is None:
+            self._rows_per_second = rate
+        else:
+            self._rows_per_second = _EWMA_ALPHA * rate + (1 - _EWMA_ALPHA) * self._rows_per_second
+        target = int(self._rows_per_second * self.target_latency)
+        self._chunk_size = min(max(target, self.min_chunk_size), self.max_chunk_size)
+
+    def _chunk_end(self, texts: list[str], start: int) -> int:
+        """Index one past the last text of the next chunk, capped by size and payload bytes."""
+        limit = min(len(texts), start + self._chunk_size)
+        payload = 0
+        end = start
+        while end < limit:
+            payload += len(texts[end].encode("utf-8")) + _TEXT_OVERHEAD_BYTES
+            if payload > self.max_payload_bytes and end > start:
+                break
+            end += 1
+        return end
+
+    async def _send(self, chunk: list[str]) -> list[int]:
+        body = json.dumps({"texts": chunk}, ensure_ascii=False).encode("utf-8")
+        started = time.perf_counter()
+        resp = await self._client.post("/predict", content=body, headers={"Content-Type": "application/json"})
+        resp.raise_for_status()
+        self._observe(len(chunk), time.perf_counter() - started)
+
+        try:
+            data = resp.json()
+        except ValueError as exc:
+            raise ValueError("Model service returned invalid JSON.") from exc
+
+        labels = data.get("labels")
+        if not isinstance(labels, list):
+            raise ValueError(f"Model service response missing 'labels' list: {data}")
+        if len(labels) != len(chunk):
+            raise ValueError(
+                f"Model service returned unexpected number of predictions: "
+                f"{len(labels)} for {len(chunk)} texts"
+            )
+        try:
+            return [int(item) for item in labels]
+        except (TypeError, ValueError) as exc:
+            raise ValueError("Model service returned non-integer predictions.") from exc
+
+    async def predict(self, texts: Sequence[str]) -> list[int]:
+        """Return labels for `texts` in input order."""
+        texts = list(texts)
+        if not texts:
+            return []
+
+        tasks: list[asyncio.Task[list[int]]] = []
+        try:
+            start = 0
+            while start < len(texts):
+                await self._semaphore.acquire()
+                if any(task.done() and not task.cancelled() and task.exception() for task in tasks):
+                    self._semaphore.release()
+                    break
+                # Size the chunk only once a slot is free, so it reflects the latest observations.
+                end = self._chunk_end(texts, start)
+                task = asyncio.create_task(self._send(texts[start:end]))
+                task.add_done_callback(lambda _: self._semaphore.release())
+                tasks.append(task)
+                start = end
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return [label for chunk_labels in results for label in chunk_labels]
+
+
+_client: ModelClient | None = None
+
+
+def get_model_client() -> ModelClient:
+    """Return the process-wide model client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = ModelClient(
+            settings.model_api_url,
+            max_concurrency=settings.model_max_concurrency,
+            timeout=settings.model_timeout,
+            target_latency=settings.model_target_latency,
+            initial_chunk_size=settings.model_initial_chunk_size,
+            min_chunk_size=settings.model_min_chunk_size,
+            max_chunk_size=settings.model_max_chunk_size,
+            max_payload_bytes=settings.model_max_payload_bytes,
+        )
+    return _client
+
+
+async def close_model_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,141 @@
+import uuid
+from typing import Sequence
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app import models
+from app.db import engine
+from app.services import rollups
+
+# LIST-partitioned by id_batch on Postgres: one partition per batch plus a DEFAULT
+# partition that only catches rows written before their batch partition existed.
+PARTITIONED_MODELS = (
+    models.RawComment,
+    models.CleanedComment,
+    models.ClassifiedComment,
+    models.CommentValidation,
+)
+
+
+def partition_name(table: str, batch_id: uuid.UUID) -> str:
+    return f"{table}_{batch_id.hex}"
+
+
+# Whether each table is partitioned in the connected database (schemas created before
+# partitioning keep plain tables); looked up once per process.
+_partitioned: dict[str, bool] = {}
+
+
+async def _is_partitioned(conn: AsyncConnection, table: str) -> bool:
+    if table not in _partitioned:
+        if conn.dialect.name != "postgresql":
+            _partitioned[table] = False
+        else:
+            relkind = await conn.scalar(
+                text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": table}
+            )
+            _partitioned[table] = relkind == "p"
+    return _partitioned[table]
+
+
+async def _has_partition(conn: AsyncConnection, name: str) -> bool:
+    return await conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+
+
+async def ensure_defaults(conn: AsyncConnection) -> None:
+    """Create the DEFAULT partitions; run after `create_all`."""
+    if conn.dialect.name != "postgresql":
+        return
+    for model in PARTITIONED_MODELS:
+        table = model.__tablename__
+        if await conn.scalar(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": table}) == "p":
+            await conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT'))
+
+
+async def ensure_batch(batch_id: uuid.UUID) -> None:
+    """Create the partitions of a new batch in every comment table, before its first row is written.
+
+    Runs in its own short transaction, committed before the caller writes rows.
+    `CREATE TABLE ... PARTITION OF` would hold an ACCESS EXCLUSIVE lock on the
+    parent until commit; a separate CREATE TABLE plus ATTACH PARTITION only
+    takes SHARE UPDATE EXCLUSIVE, so readers and writers of other batches go on.
+    The caller must not hold locks on the comment tables (an open read
+    transaction pins the DEFAULT partition that ATTACH checks).
+    """
+    async with engine.begin() as conn:
+        if conn.dialect.name != "postgresql":
+            return
+        # Two requests creating the same batch must not both attach it.
+        await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:batch))"), {"batch": str(batch_id)})
+        for model in PARTITIONED_MODELS:
+            table = model.__tablename__
+            name = partition_name(table, batch_id)
+            if not await _is_partitioned(conn, table) or await _has_partition(conn, name):
+                continue
+            await conn.execute(text(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+            await conn.execute(text(f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" FOR VALUES IN (\'{batch_id}\')'))
+
+
+async def discard_batch(batch_id: uuid.UUID) -> None:
+    """Drop the empty partitions left by a batch whose first write failed."""
+    async with engine.begin() as conn:
+        if conn.dialect.name != "postgresql":
+            return
+        for model in PARTITIONED_MODELS:
+            table = model.__tablename__
+            if await _is_partitioned(conn, table):
+                await conn.execute(text(f'DROP TABLE IF EXISTS "{partition_name(table, batch_id)}"'))
+
+
+async def truncate_batch(session: AsyncSession, batch_id: uuid.UUID, tables: Sequence[type]) -> None:
+    """Remove every row of the batch from `tables`.
+
+    A batch with its own partition is emptied with TRUNCATE, which leaves no dead
+    tuples behind; otherwise (SQLite, unpartitioned or legacy rows) it falls back to DELETE.
+    """
+    conn = await session.connection()
+    for model in tables:
+        table = model.__tablename__
+        name = partition_name(table, batch_id)
+        if await _is_partitioned(conn, table) and await _has_partition(conn, name):
+            await session.execute(text(f'TRUNCATE "{name}"'))
+        else:
+            await session.execute(delete(model).where(model.id_batch == batch_id))
+
+
+async def drop_batch(session: AsyncSession, batch_id: uuid.UUID) -> None:
+    """Delete a batch everywhere; its comment partitions are dropped as a whole. The caller commits."""
+    await rollups.clear_batch(session, batch_id)
+    conn = await session.connection()
+    for model in PARTITIONED_MODELS:
+        table = model.__tablename__
+        name = partition_name(table, batch_id)
+        if await _is_partitioned(conn, table) and await _has_partition(conn, name):
+            await session.execute(text(f'DROP TABLE "{name}"'))
+        # Rows that landed in the DEFAULT partition (or an unpartitioned table).
+        await session.execute(delete(model).where(model.id_batch == batch_id))
+    for model in (models.BatchSummary, models.Job):
+        await session.execute(delete(model).where(model.id_batch == batch_id))
+
+
+async def expired_batches(session: AsyncSession, before) -> list[uuid.UUID]:
+    """Batches last touched before `before`.
+
+    Age comes from `batch_summary.time`. Batches that never got a summary (failed
+    or never-run processing, rows added through POST /records) are aged by their
+    newest job, or else by their newest raw comment time.
+    """
+    summary, job, raw = models.BatchSummary, models.Job, models.RawComment
+    result = await session.execute(select(summary.id_batch).where(summary.time < before))
+    expired = list(result.scalars().all())
+
+    orphans = (
+        select(raw.id_batch, func.max(raw.time).label("seen"))
+        .where(~select(summary.id_batch).where(summary.id_batch == raw.id_batch).exists())
+        .group_by(raw.id_batch)
+        .subquery()
+    )
+    last_job = select(func.max(job.created_at)).where(job.id_batch == orphans.c.id_batch).scalar_subquery()
+    result = await session.execute(select(orphans.c.id_batch).where(func.coalesce(last_job, orphans.c.seen) < before))
+    return expired + list(result.scalars().all())
@@ -1,133 +1,273 @@
 import uuid
 from datetime import datetime, timezone
-from typing import Sequence
+from typing import Awaitable, Callable, Sequence
 
-import httpx
-from sqlalchemy import delete, select
+from sqlalchemy import LargeBinary, cast, delete, distinct, func, insert, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models
 from app.config import get_settings
+from app.services import bulk, cleaning, model_client, partitions, prediction_cache, response_cache, rollups
 
 settings = get_settings()
 
-REMOTE_BATCH_SIZE = 3000
-BASE_URL = "https://breathlessly-glowing-turnstone.cloudpub.ru".rstrip("/")
+CLEANED_COLUMNS = ("id_comment", "id_batch", "comment_clean", "src", "time")
+CLASSIFIED_COLUMNS = CLEANED_COLUMNS + ("type_comment", "model_version")
+
+# model_version of labels set by hand through PUT /classified; run_model never replaces them.
+MANUAL_VERSION = "manual"
+
+ProgressCallback = Callable[[int], Awaitable[None]]
 
 
 async def _predict_labels(texts: Sequence[str]) -> list[int]:
-    texts = list(texts)
-    if not texts:
-        return []
-
-    all_labels: list[int] = []
-
-    async with httpx.AsyncClient(
-        base_url=BASE_URL,
-        timeout=60,          # побольше, чем 30
-        follow_redirects=True,
-        http2=False,         # как у curl – HTTP/1.1
-        verify=True,         # сертификат у тебя нормальный, verify=False уже не нужно
-    ) as client:
-        for i in range(0, len(texts), REMOTE_BATCH_SIZE):
-            chunk = texts[i:i + REMOTE_BATCH_SIZE]
-            payload = {"texts": chunk}
-
-            resp = await client.post("/predict", json=payload)
-            resp.raise_for_status()
-
-            try:
-                data = resp.json()
-            except ValueError as exc:
-                raise ValueError("Model service returned invalid JSON.") from exc
-
-            labels = data.get("labels")
-            if not isinstance(labels, list):
-                raise ValueError(f"Model service response missing 'labels' list: {data}")
-            if len(labels) != len(chunk):
-                raise ValueError(
-                    f"Model service returned unexpected number of predictions: "
-                    f"{len(labels)} for {len(chunk)} texts"
-                )
-
-            try:
-                all_labels.extend(int(item) for item in labels)
-            except (TypeError, ValueError) as exc:
-                raise ValueError("Model service returned non-integer predictions.") from exc
-
-    return all_labels
-
-
-async def process_batch(session: AsyncSession, batch_id: uuid.UUID) -> None:
-    raw_rows = (
-        await session.execute(select(models.RawComment).where(models.RawComment.id_batch == batch_id))
-    ).scalars().all()
-    if not raw_rows:
-        raise ValueError("�?��' �?���?�?�<�: �?�>�? �?��������?�?�?�?�? batch_id.")
-
-    await session.execute(delete(models.CleanedComment).where(models.CleanedComment.id_batch == batch_id))
-
-    cleaned = [
-        models.CleanedComment(
-            id_comment=row.id_comment,
-            id_batch=batch_id,
-            comment_clean=row.comment,
-            src=row.src,
-            time=row.time,
+    return await model_client.get_model_client().predict(texts)
+
+
+def _dedupe(texts: Sequence[str]) -> tuple[list[str], list[int]]:
+    """Return the distinct texts and, for every input, the index of its distinct text."""
+    index: dict[str, int] = {}
+    positions = [index.setdefault(text, len(index)) for text in texts]
+    return list(index), positions
+
+
+async def _has_raw_rows(session: AsyncSession, batch_id: uuid.UUID) -> bool:
+    found = await session.scalar(
+        select(models.RawComment.id_comment).where(models.RawComment.id_batch == batch_id).limit(1)
+    )
+    return found is not None
+
+
+async def process_batch(
+    session: AsyncSession,
+    batch_id: uuid.UUID,
+    steps: Sequence[str] | None = None,
+    incremental: bool = False,
+) -> int:
+    """Copy a batch from raw_comments to cleaned_comments with one INSERT ... SELECT.
+
+    Cleaning runs in the database as well; `steps` defaults to `Settings.cleaning_steps`.
+    With `incremental` only raw rows without a cleaned counterpart are copied and
+    existing cleaned rows are kept. Returns the number of cleaned rows written.
+    """
+    steps = settings.cleaning_steps if steps is None else steps
+    comment_clean = cleaning.build_expression(models.RawComment.comment, steps)
+
+    source = select(
+        models.RawComment.id_comment,
+        models.RawComment.id_batch,
+        comment_clean,
+        models.RawComment.src,
+        models.RawComment.time,
+    ).where(models.RawComment.id_batch == batch_id)
+    if incremental:
+        cleaned = models.CleanedComment
+        source = source.where(
+            ~select(cleaned.id_comment)
+            .where(cleaned.id_batch == models.RawComment.id_batch, cleaned.id_comment == models.RawComment.id_comment)
+            .exists()
         )
-        for row in raw_rows
-    ]
-    session.add_all(cleaned)
+    else:
+        await partitions.truncate_batch(session, batch_id, [models.CleanedComment])
+
+    result = await session.execute(insert(models.CleanedComment).from_select(CLEANED_COLUMNS, source))
+    if not result.rowcount:
+        # Nothing new is fine for an incremental pass over a non-empty batch.
+        if not incremental or not await _has_raw_rows(session, batch_id):
+            await session.rollback()
+            raise ValueError("�?��' �?���?�?�<�: �?�>�? �?��������?�?�?�?�? batch_id.")
     await session.commit()
+    return result.rowcount
 
 
-async def run_model(session: AsyncSession, batch_id: uuid.UUID) -> None:
-    cleaned_rows = (
-        await session.execute(select(models.CleanedComment).where(models.CleanedComment.id_batch == batch_id))
-    ).scalars().all()
-    if not cleaned_rows:
-        raise ValueError("�?��' �?�ؐ�%��?�?�<�: �?���?�?�<�: �?�>�? �?��������?�?�?�?�? batch_id. ���?���ؐ��>�� �?�<���?�?��'�� /process_batch.")
+async def _get_summary(session: AsyncSession, batch_id: uuid.UUID) -> models.BatchSummary:
+    summary = await session.get(models.BatchSummary, batch_id)
+    if summary is None:
+        summary = models.BatchSummary(
+            id_batch=batch_id,
+            time=datetime.now(timezone.utc),
+            f1_metric=0.0,
+            classified_count=0,
+        )
+        session.add(summary)
+    return summary
 
-    await session.execute(delete(models.ClassifiedComment).where(models.ClassifiedComment.id_batch == batch_id))
-    await session.execute(delete(models.ValidationComment).where(models.ValidationComment.id_batch == batch_id))
 
-    comments = [row.comment_clean for row in cleaned_rows]
-    predictions = await _predict_labels(comments)
-    if len(predictions) != len(cleaned_rows):
-        raise RuntimeError("Prediction count mismatch.")
+async def _update_dedup_stats(session: AsyncSession, batch_id: uuid.UUID, summary: models.BatchSummary) -> None:
+    """Recompute the dedup counters over all classified rows of the batch (after deletes)."""
+    sqlite = (await session.connection()).dialect.name == "sqlite"
 
-    classified: list[models.ClassifiedComment] = []
-    validation: list[models.ValidationComment] = []
-    for row, label in zip(cleaned_rows, predictions):
-        classified_item = models.ClassifiedComment(
-            id_comment=row.id_comment,
-            id_batch=batch_id,
-            comment_clean=row.comment_clean,
-            src=row.src,
-            time=row.time,
-            type_comment=int(label),
+    def size(column):
+        # UTF-8 bytes; SQLite has no octet_length.
+        return func.length(cast(column, LargeBinary)) if sqlite else func.octet_length(column)
+
+    classified = models.ClassifiedComment
+    texts = select(classified.comment_clean).where(classified.id_batch == batch_id).distinct().subquery()
+    rows, unique, total_bytes, unique_bytes = (
+        await session.execute(
+            select(
+                func.count(),
+                func.count(distinct(classified.comment_clean)),
+                func.sum(size(classified.comment_clean)),
+                select(func.sum(size(texts.c.comment_clean))).scalar_subquery(),
+            ).where(classified.id_batch == batch_id)
         )
-        classified.append(classified_item)
-        validation.append(
-            models.ValidationComment(
-                id_comment=row.id_comment,
-                id_batch=batch_id,
-                comment_clean=row.comment_clean,
-                src=row.src,
-                time=row.time,
-                type_comment=int(label),
-                validation=False,
+    ).one()
+    summary.unique_count = unique
+    summary.unique_ratio = unique / rows if rows else 1.0
+    summary.dedup_bytes_saved = int(total_bytes or 0) - int(unique_bytes or 0)
+
+
+async def _known_texts(session: AsyncSession, batch_id: uuid.UUID, texts: Sequence[str]) -> set[str]:
+    """Which of `texts` the batch already has classified rows for (equality uses the trigram index)."""
+    classified = models.ClassifiedComment
+    known: set[str] = set()
+    for start in range(0, len(texts), bulk.INSERT_BATCH_SIZE):
+        result = await session.execute(
+            select(classified.comment_clean)
+            .where(
+                classified.id_batch == batch_id,
+                classified.comment_clean.in_(texts[start:start + bulk.INSERT_BATCH_SIZE]),
             )
+            .distinct()
         )
+        known.update(result.scalars().all())
+    return known
 
-    session.add_all(classified + validation)
 
-    summary = await session.get(models.BatchSummary, batch_id)
-    now = datetime.now(timezone.utc)
-    if summary:
-        summary.time = now
-        summary.f1_metric = 0.0
-    else:
-        session.add(models.BatchSummary(id_batch=batch_id, time=now, f1_metric=0.0))
+async def _classify_chunk(session: AsyncSession, batch_id: uuid.UUID, rows: Sequence) -> tuple[int, int]:
+    """Predict and store labels for one chunk of cleaned rows.
+
+    Returns (texts new to the batch, UTF-8 bytes of rows whose text the batch already had).
+    """
+    comments = [row.comment_clean for row in rows]
+    unique_texts, positions = _dedupe(comments)
+    known = await _known_texts(session, batch_id, unique_texts)
+    new_texts = [text for text in unique_texts if text not in known]
+    repeated_bytes = sum(len(text.encode("utf-8")) for text in comments) - sum(
+        len(text.encode("utf-8")) for text in new_texts
+    )
+    unique_labels = await prediction_cache.get_prediction_cache().predict(session, unique_texts, _predict_labels)
+    if len(unique_labels) != len(unique_texts):
+        raise RuntimeError("Prediction count mismatch.")
+
+    classified = [
+        (row.id_comment, batch_id, row.comment_clean, row.src, row.time, int(unique_labels[pos]), settings.model_version)
+        for row, pos in zip(rows, positions)
+    ]
+    await bulk.copy_rows(session, models.ClassifiedComment.__table__, CLASSIFIED_COLUMNS, classified)
+    await rollups.apply(session, batch_id, rollups.count_rows((item[4], item[3], item[5]) for item in classified))
+    return len(new_texts), repeated_bytes
 
+
+async def run_model(
+    session: AsyncSession,
+    batch_id: uuid.UUID,
+    reset: bool = False,
+    on_progress: ProgressCallback | None = None,
+) -> int:
+    """Classify cleaned rows that have no label for the current model version.
+
+    Rows are predicted and committed in chunks of `Settings.run_model_chunk_size`,
+    so a failed run keeps every finished chunk and a rerun only predicts what is
+    still missing. `reset` drops all labels of the batch first. `on_progress`
+    receives `BatchSummary.classified_count` after each chunk; the counter is
+    adjusted by the rows deleted and written here instead of being recounted.
+    Rows whose cleaned counterpart is gone or has a different text are dropped
+    as well. Returns the number of rows classified by this call.
+    """
+    first = await session.scalar(
+        select(models.CleanedComment.id_comment).where(models.CleanedComment.id_batch == batch_id).limit(1)
+    )
+    if first is None:
+        raise ValueError("�?��' �?�ؐ�%��?�?�<�: �?���?�?�<�: �?�>�? �?��������?�?�?�?�? batch_id. ���?���ؐ��>�� �?�<���?�?��'�� /process_batch.")
+
+    summary = await _get_summary(session, batch_id)
+    deleted = 0
+    if reset:
+        # Everything goes, so empty the batch partitions instead of deleting row by row.
+        await partitions.truncate_batch(session, batch_id, [models.CommentValidation, models.ClassifiedComment])
+        await rollups.clear_batch(session, batch_id)
+        summary.classified_count = 0
+        summary.unique_count = summary.dedup_bytes_saved = 0
+        await response_cache.bump_version(session, batch_id)
+    else:
+        # Labels from another model version are re-predicted, and so are rows whose cleaned
+        # counterpart was deleted or re-cleaned to another text; other manual corrections are kept.
+        classified, cleaned = models.ClassifiedComment, models.CleanedComment
+        outdated = ~(
+            select(cleaned.id_comment)
+            .where(
+                cleaned.id_batch == classified.id_batch,
+                cleaned.id_comment == classified.id_comment,
+                cleaned.comment_clean == classified.comment_clean,
+            )
+            .exists()
+        )
+        stale = (classified.id_batch == batch_id) & or_(
+            classified.model_version.is_(None),
+            classified.model_version.notin_([settings.model_version, MANUAL_VERSION]),
+            outdated,
+        )
+        await session.execute(
+            delete(models.CommentValidation).where(
+                models.CommentValidation.id_batch == batch_id,
+                models.CommentValidation.id_comment.in_(select(models.ClassifiedComment.id_comment).where(stale)),
+            )
+        )
+        deleted = (await session.execute(delete(models.ClassifiedComment).where(stale))).rowcount
+        if deleted:
+            await rollups.rebuild_batch(session, batch_id)
+            summary.classified_count = max(0, (summary.classified_count or 0) - deleted)
+            # Removed rows may have held the last copy of a text; only this path rescans the batch.
+            await _update_dedup_stats(session, batch_id, summary)
+            await response_cache.bump_version(session, batch_id)
     await session.commit()
+
+    classified = models.ClassifiedComment
+    missing = (
+        select(
+            models.CleanedComment.id_comment,
+            models.CleanedComment.comment_clean,
+            models.CleanedComment.src,
+            models.CleanedComment.time,
+        )
+        .where(
+            models.CleanedComment.id_batch == batch_id,
+            ~select(classified.id_comment)
+            .where(
+                classified.id_batch == models.CleanedComment.id_batch,
+                classified.id_comment == models.CleanedComment.id_comment,
+            )
+            .exists(),
+        )
+        .order_by(models.CleanedComment.id_comment)
+        .limit(settings.run_model_chunk_size)
+    )
+
+    done = 0
+    last_id: int | None = None
+    while True:
+        stmt = missing if last_id is None else missing.where(models.CleanedComment.id_comment > last_id)
+        rows = (await session.execute(stmt)).all()
+        if not rows:
+            break
+        last_id = rows[-1].id_comment
+
+        new_texts, repeated_bytes = await _classify_chunk(session, batch_id, rows)
+        done += len(rows)
+
+        summary = await _get_summary(session, batch_id)
+        summary.time = datetime.now(timezone.utc)
+        summary.f1_metric = 0.0
+        summary.metrics = None
+        summary.classified_count = (summary.classified_count or 0) + len(rows)
+        # Batch-wide dedup counters, advanced by this chunk without rescanning the batch.
+        summary.unique_count = (summary.unique_count or 0) + new_texts
+        summary.dedup_bytes_saved = (summary.dedup_bytes_saved or 0) + repeated_bytes
+        summary.unique_ratio = summary.unique_count / summary.classified_count
+        await response_cache.bump_version(session, batch_id)
+        await session.commit()
+        if on_progress is not None:
+            await on_progress(summary.classified_count)
+    return done
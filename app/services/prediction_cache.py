@@ -0,0 +1,151 @@
+import hashlib
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.config import get_settings
+from app.services import bulk
+
+settings = get_settings()
+
+_WHITESPACE = re.compile(r"\s+")
+
+Predictor = Callable[[Sequence[str]], Awaitable[list[int]]]
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFKC, collapsed whitespace, stripped."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Bounded in-process mapping that evicts the least recently used key."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, int] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> int | None:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: int) -> None:
+        if self.max_entries <= 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class PredictionCache:
+    """Two-tier cache of model labels keyed by normalized text and model version.
+
+    Lookups go to the in-process LRU first, then to `prediction_cache` in
+    Postgres; only the remaining misses are sent to the model. Counters are
+    per process and count the texts passed to `predict`; `run_model` passes
+    each distinct cleaned text of a chunk once.
+    """
+
+    def __init__(self, max_entries: int, model_version: str):
+        self.model_version = model_version
+        self.memory = LRUCache(max_entries)
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, int | float | str]:
+        total = self.memory_hits + self.db_hits + self.misses
+        return {
+            "model_version": self.model_version,
+            "memory_entries": len(self.memory),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.db_hits) / total if total else 0.0,
+        }
+
+    async def _load(self, session: AsyncSession, keys: list[str]) -> dict[str, int]:
+        found: dict[str, int] = {}
+        for start in range(0, len(keys), bulk.INSERT_BATCH_SIZE):
+            chunk = keys[start:start + bulk.INSERT_BATCH_SIZE]
+            result = await session.execute(
+                select(models.PredictionCache.text_hash, models.PredictionCache.type_comment).where(
+                    models.PredictionCache.model_version == self.model_version,
+                    models.PredictionCache.text_hash.in_(chunk),
+                )
+            )
+            found.update({key: label for key, label in result.all()})
+        return found
+
+    async def _store(self, session: AsyncSession, entries: dict[str, int]) -> None:
+        rows = [
+            {"text_hash": key, "model_version": self.model_version, "type_comment": label}
+            for key, label in entries.items()
+        ]
+        # Another worker may have cached the same text concurrently.
+        stmt = (await bulk.upsert_insert(session, models.PredictionCache.__table__)).on_conflict_do_nothing()
+        for start in range(0, len(rows), bulk.INSERT_BATCH_SIZE):
+            await session.execute(stmt, rows[start:start + bulk.INSERT_BATCH_SIZE])
+
+    async def predict(self, session: AsyncSession, texts: Sequence[str], predictor: Predictor) -> list[int]:
+        """Return labels for `texts`, calling `predictor` only for cache misses.
+
+        New labels are written in the session's transaction; the caller commits.
+        """
+        keys = [text_hash(text) for text in texts]
+        labels: list[int | None] = [self.memory.get(key) for key in keys]
+        self.memory_hits += sum(label is not None for label in labels)
+
+        unresolved = list(dict.fromkeys(key for key, label in zip(keys, labels) if label is None))
+        if unresolved:
+            stored = await self._load(session, unresolved)
+            for key, label in stored.items():
+                self.memory.put(key, label)
+            for idx, key in enumerate(keys):
+                if labels[idx] is None and key in stored:
+                    labels[idx] = stored[key]
+                    self.db_hits += 1
+
+        # One model call per distinct normalized text among the misses.
+        pending: dict[str, str] = {}
+        for idx, key in enumerate(keys):
+            if labels[idx] is None:
+                self.misses += 1
+                pending.setdefault(key, texts[idx])
+        if pending:
+            predicted = await predictor(list(pending.values()))
+            fresh = dict(zip(pending.keys(), predicted))
+            await self._store(session, fresh)
+            for key, label in fresh.items():
+                self.memory.put(key, label)
+            labels = [fresh[key] if label is None else label for key, label in zip(keys, labels)]
+
+        return [int(label) for label in labels]
+
+
+_cache: PredictionCache | None = None
+
+
+def get_prediction_cache() -> PredictionCache:
+    global _cache
+    if _cache is None:
+        _cache = PredictionCache(settings.prediction_cache_size, settings.model_version)
+    return _cache
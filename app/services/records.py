@@ -1,10 +1,22 @@
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Sequence
 
-from sqlalchemy import func, select
+from sqlalchemy import JSON, Integer, column, func, literal_column, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models, schemas
+from app.services import bulk, partitions, pipeline, response_cache, rollups
+
+# Upper bound for `limit` of the paginated listings.
+MAX_PAGE_SIZE = 1000
+# Trigram search needs at least one full trigram to use the index.
+SEARCH_MIN_LENGTH = 3
+# Control characters not expected in review text; they mark ts_headline matches.
+SEARCH_START_SEL = "\x02"
+SEARCH_STOP_SEL = "\x03"
+_RUSSIAN = literal_column("'russian'::regconfig")
 
 
 def _resolve_time(dt: datetime | None) -> datetime:
@@ -13,18 +25,281 @@ def _resolve_time(dt: datetime | None) -> datetime:
     return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
 
 
-async def list_records(session: AsyncSession) -> list[models.RawComment]:
-    result = await session.execute(select(models.RawComment).order_by(models.RawComment.id_comment))
-    return result.scalars().all()
+def encode_cursor(batch_id: uuid.UUID, id_comment: int, time: datetime | None = None) -> str:
+    cursor = f"{batch_id}:{id_comment}"
+    return cursor if time is None else f"{cursor}:{time.isoformat()}"
+
+
+def decode_cursor(cursor: str) -> tuple[uuid.UUID, int, datetime | None]:
+    batch, _, rest = cursor.partition(":")
+    id_comment, _, time = rest.partition(":")
+    try:
+        return uuid.UUID(batch), int(id_comment), datetime.fromisoformat(time) if time else None
+    except ValueError as exc:
+        raise ValueError("Invalid cursor.") from exc
+
+
+async def _keyset_page(
+    session: AsyncSession,
+    model,
+    conditions: list,
+    after: str | None,
+    limit: int,
+    batch_id: uuid.UUID | None = None,
+    by_time: bool = False,
+):
+    """One page of `model` rows and the cursor of the next one.
+
+    Across batches rows are ordered by (id_batch, id_comment). Within one batch
+    the key is id_comment alone, so `(id_batch, <filter>, id_comment)` indexes
+    serve `id_comment > :cursor` directly; with `by_time` (a time range) it is
+    (time, id_comment) on the `(id_batch, time, id_comment)` index. Either way a
+    page is an index range scan of `limit + 1` rows regardless of depth.
+    """
+    limit = min(limit, MAX_PAGE_SIZE)
+    conditions = list(conditions)
+    if batch_id is None:
+        order = (model.id_batch, model.id_comment)
+    elif by_time:
+        order = (model.time, model.id_comment)
+    else:
+        order = (model.id_comment,)
+    if after is not None:
+        cursor_batch, cursor_id, cursor_time = decode_cursor(after)
+        if batch_id is None:
+            conditions.append(tuple_(*order) > tuple_(cursor_batch, cursor_id))
+        elif by_time:
+            if cursor_time is None:
+                raise ValueError("Invalid cursor.")
+            conditions.append(tuple_(*order) > tuple_(cursor_time, cursor_id))
+        else:
+            conditions.append(model.id_comment > cursor_id)
+    result = await session.execute(select(model).where(*conditions).order_by(*order).limit(limit + 1))
+    items = result.scalars().all()
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    last = items[-1]
+    return items, encode_cursor(last.id_batch, last.id_comment, last.time if batch_id is not None and by_time else None)
+
+
+def _filters(model, batch_id: uuid.UUID | None, src: str | None, time_from: datetime | None, time_to: datetime | None) -> list:
+    conditions = []
+    if batch_id is not None:
+        conditions.append(model.id_batch == batch_id)
+    if src is not None:
+        conditions.append(model.src == src)
+    if time_from is not None:
+        conditions.append(model.time >= _resolve_time(time_from))
+    if time_to is not None:
+        conditions.append(model.time < _resolve_time(time_to))
+    return conditions
+
+
+async def list_records(
+    session: AsyncSession,
+    batch_id: uuid.UUID | None = None,
+    src: str | None = None,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    after: str | None = None,
+    limit: int = 100,
+) -> tuple[list[models.RawComment], str | None]:
+    conditions = _filters(models.RawComment, batch_id, src, time_from, time_to)
+    by_time = time_from is not None or time_to is not None
+    return await _keyset_page(session, models.RawComment, conditions, after, limit, batch_id, by_time)
+
+
+async def list_classified(
+    session: AsyncSession,
+    batch_id: uuid.UUID,
+    type_comment: int | None = None,
+    src: str | None = None,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    after: str | None = None,
+    limit: int = 10,
+) -> tuple[list[models.ClassifiedComment], str | None]:
+    conditions = _filters(models.ClassifiedComment, batch_id, src, time_from, time_to)
+    if type_comment is not None:
+        conditions.append(models.ClassifiedComment.type_comment == type_comment)
+    by_time = time_from is not None or time_to is not None
+    return await _keyset_page(session, models.ClassifiedComment, conditions, after, limit, batch_id, by_time)
+
+
+async def has_classified(session: AsyncSession, batch_id: uuid.UUID) -> bool:
+    found = await session.scalar(
+        select(models.ClassifiedComment.id_comment).where(models.ClassifiedComment.id_batch == batch_id).limit(1)
+    )
+    return found is not None
+
+
+def _like_pattern(query: str) -> str:
+    escaped = query.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+    return f"%{escaped}%"
+
+
+def _fold(text: str) -> str:
+    # Lowercase char by char, keeping chars whose lowercase is longer (e.g. "İ"), so offsets stay valid.
+    return "".join(lower if len(lower := char.lower()) == 1 else char for char in text)
+
+
+def _substring_spans(text: str, query: str) -> list[tuple[int, int]]:
+    spans = []
+    haystack, needle = _fold(text), _fold(query)
+    start = haystack.find(needle)
+    while start != -1 and needle:
+        spans.append((start, start + len(needle)))
+        start = haystack.find(needle, start + len(needle))
+    return spans
+
+
+def _marked_spans(marked: str) -> list[tuple[int, int]]:
+    """Offsets of the fragments ts_headline wrapped in SEARCH_START_SEL/SEARCH_STOP_SEL, in the unmarked text."""
+    spans = []
+    position = 0
+    start = None
+    for char in marked:
+        if char == SEARCH_START_SEL:
+            start = position
+        elif char == SEARCH_STOP_SEL:
+            if start is not None:
+                spans.append((start, position))
+            start = None
+        else:
+            position += 1
+    return spans
+
+
+async def search_classified(
+    session: AsyncSession,
+    query: str,
+    mode: str = "substring",
+    batch_id: uuid.UUID | None = None,
+    type_comment: int | None = None,
+    src: str | None = None,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    after: str | None = None,
+    limit: int = 20,
+) -> tuple[list[tuple[models.ClassifiedComment, list[tuple[int, int]]]], str | None]:
+    """Keyset page of classified comments matching `query`, each with its highlight spans.
+
+    `substring` is a case-insensitive ILIKE served by the pg_trgm GIN index;
+    `fulltext` matches Russian word forms through `to_tsvector('russian', ...)`.
+    Spans are character offsets into `comment_clean`.
+    """
+    query = query.strip()
+    classified = models.ClassifiedComment
+    conditions = _filters(classified, batch_id, src, time_from, time_to)
+    if type_comment is not None:
+        conditions.append(classified.type_comment == type_comment)
+    if mode == "substring":
+        if len(query) < SEARCH_MIN_LENGTH:
+            raise ValueError(f"Query must be at least {SEARCH_MIN_LENGTH} characters long.")
+        conditions.append(classified.comment_clean.ilike(_like_pattern(query), escape="!"))
+    elif mode == "fulltext":
+        if not query:
+            raise ValueError("Query must not be empty.")
+        tsquery = func.plainto_tsquery(_RUSSIAN, query)
+        conditions.append(func.to_tsvector(_RUSSIAN, classified.comment_clean).op("@@")(tsquery))
+    else:
+        raise ValueError("mode must be 'substring' or 'fulltext'.")
+
+    items, next_cursor = await _keyset_page(session, classified, conditions, after, limit)
+    if mode == "substring":
+        return [(item, _substring_spans(item.comment_clean, query)) for item in items], next_cursor
+
+    headlines = {}
+    if items:
+        options = f"StartSel={SEARCH_START_SEL}, StopSel={SEARCH_STOP_SEL}, HighlightAll=true"
+        result = await session.execute(
+            select(
+                classified.id_batch,
+                classified.id_comment,
+                func.ts_headline(_RUSSIAN, classified.comment_clean, func.plainto_tsquery(_RUSSIAN, query), options),
+            ).where(tuple_(classified.id_batch, classified.id_comment).in_([(i.id_batch, i.id_comment) for i in items]))
+        )
+        headlines = {(batch, id_comment): marked for batch, id_comment, marked in result.all()}
+    return [
+        (item, _marked_spans(headlines.get((item.id_batch, item.id_comment), ""))) for item in items
+    ], next_cursor
+
+
+async def mark_validated(session: AsyncSession, batch_id: uuid.UUID, labels: Sequence[tuple[int, int]]) -> None:
+    """Record (id_comment, corrected label) pairs of a batch as manually reviewed."""
+    if not labels:
+        return
+    table = models.CommentValidation.__table__
+    stmt = await bulk.upsert_insert(session, table)
+    stmt = stmt.values(
+        [
+            {"id_comment": id_comment, "id_batch": batch_id, "validated": True, "corrected_label": label}
+            for id_comment, label in labels
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.id_comment, table.c.id_batch],
+        set_={"validated": stmt.excluded.validated, "corrected_label": stmt.excluded.corrected_label},
+    )
+    await session.execute(stmt)
+
+
+async def relabel_classified(session: AsyncSession, batch_id: uuid.UUID, changes: Iterable[tuple[int, int]]) -> int:
+    """Apply manual (id_comment, type_comment) corrections to a batch in one transaction.
+
+    Old labels are read (and locked) with one join against a VALUES list, then
+    classified rows are updated set-based with `UPDATE ... FROM (VALUES ...)` and
+    marked as reviewed with one multi-row upsert, the rollup gets the label
+    deltas and cached reports are invalidated. Returns the number of classified rows updated; unknown ids are skipped.
+    """
+    labels = {int(id_comment): int(type_comment) for id_comment, type_comment in changes}
+    classified = models.ClassifiedComment
+    # Lock in id order across chunks and concurrent requests, so overlapping relabels cannot deadlock.
+    items = sorted(labels.items())
+    updated = 0
+    edits = []
+    for start in range(0, len(items), bulk.INSERT_BATCH_SIZE):
+        chunk = values(
+            column("id_comment", Integer), column("type_comment", Integer), name="changes"
+        ).data(items[start:start + bulk.INSERT_BATCH_SIZE])
+        current = await session.execute(
+            select(classified.id_comment, classified.time, classified.src, classified.type_comment)
+            .join(chunk, chunk.c.id_comment == classified.id_comment)
+            .where(classified.id_batch == batch_id)
+            .order_by(classified.id_comment)
+            .with_for_update(of=classified)
+        )
+        matched = current.all()
+        edits.extend((ts, src, old, labels[id_comment]) for id_comment, ts, src, old in matched)
+        result = await session.execute(
+            update(classified)
+            .where(classified.id_batch == batch_id, classified.id_comment == chunk.c.id_comment)
+            .values(type_comment=chunk.c.type_comment, model_version=pipeline.MANUAL_VERSION)
+            .execution_options(synchronize_session=False)
+        )
+        updated += result.rowcount
+        await mark_validated(session, batch_id, [(id_comment, labels[id_comment]) for id_comment, *_ in matched])
+    if updated:
+        await rollups.apply(session, batch_id, rollups.relabel_deltas(edits))
+        await response_cache.bump_version(session, batch_id)
+    await session.commit()
+    return updated
 
 
 async def create_record(session: AsyncSession, payload: schemas.RecordCreate) -> models.RawComment:
     batch_id = payload.id_batch or uuid.uuid4()
-    # Find next available id_comment within this batch (sequential).
-    result = await session.execute(
-        select(func.max(models.RawComment.id_comment)).where(models.RawComment.id_batch == batch_id)
-    )
-    next_id = (result.scalar() or 0) + 1
+    next_id = 1
+    if payload.id_batch is not None:
+        # Find next available id_comment within this batch (sequential).
+        result = await session.execute(
+            select(func.max(models.RawComment.id_comment)).where(models.RawComment.id_batch == batch_id)
+        )
+        next_id = (result.scalar() or 0) + 1
+    if next_id == 1:
+        # Release the read locks first; ensure_batch attaches partitions from another connection.
+        await session.rollback()
+        await partitions.ensure_batch(batch_id)
 
     record = models.RawComment(
         id_comment=next_id,
@@ -56,13 +331,24 @@ async def count_batch_records(session: AsyncSession, batch_id: uuid.UUID) -> int
     return int(result.scalar() or 0)
 
 
+def _rollup_bucket(granularity: str, day=models.SentimentRollup.day):
+    if granularity == "day":
+        return day.label("bucket")
+    # Week and month buckets are derived from the daily rollup rows.
+    return func.date_trunc(granularity, day).label("bucket")
+
+
+def _bucket_date(value) -> str:
+    return (value.date() if isinstance(value, datetime) else value).isoformat()
+
+
 async def sentiment_share(session: AsyncSession, batch_id: uuid.UUID) -> dict[str, int]:
     result = await session.execute(
-        select(models.ClassifiedComment.type_comment, func.count())
-        .where(models.ClassifiedComment.id_batch == batch_id)
-        .group_by(models.ClassifiedComment.type_comment)
+        select(models.SentimentRollup.type_comment, func.sum(models.SentimentRollup.count))
+        .where(models.SentimentRollup.id_batch == batch_id)
+        .group_by(models.SentimentRollup.type_comment)
     )
-    counts = {row[0]: row[1] for row in result.all()}
+    counts = {row[0]: int(row[1] or 0) for row in result.all()}
     mapping = {0: "negative", 1: "neutral", 2: "positive"}
     return {mapping[k]: counts.get(k, 0) for k in mapping}
 
@@ -70,19 +356,20 @@ async def sentiment_share(session: AsyncSession, batch_id: uuid.UUID) -> dict[st
 async def review_timeseries(session: AsyncSession, batch_id: uuid.UUID, granularity: str) -> list[dict[str, str | int]]:
     if granularity not in {"day", "week", "month"}:
         granularity = "day"
-    bucket = func.date_trunc(granularity, models.RawComment.time).label("bucket")
+    bucket = _rollup_bucket(granularity)
+    total = func.sum(models.SentimentRollup.count)
     result = await session.execute(
-        select(bucket, func.count())
-        .where(models.RawComment.id_batch == batch_id)
+        select(bucket, total)
+        .where(models.SentimentRollup.id_batch == batch_id)
         .group_by(bucket)
+        .having(total > 0)
         .order_by(bucket)
     )
     series = []
     for ts, count in result.all():
         if ts is None:
             continue
-        date_value = ts.date().isoformat()
-        series.append({"date": date_value, "value": int(count)})
+        series.append({"date": _bucket_date(ts), "value": int(count)})
     return series
 
 
@@ -93,11 +380,13 @@ async def classified_sentiment_timeseries(
 ) -> dict[str, list[dict[str, str | int]]]:
     if granularity not in {"day", "week", "month"}:
         granularity = "day"
-    bucket = func.date_trunc(granularity, models.ClassifiedComment.time).label("bucket")
+    bucket = _rollup_bucket(granularity)
+    total = func.sum(models.SentimentRollup.count)
     result = await session.execute(
-        select(bucket, models.ClassifiedComment.type_comment, func.count())
-        .where(models.ClassifiedComment.id_batch == batch_id)
-        .group_by(bucket, models.ClassifiedComment.type_comment)
+        select(bucket, models.SentimentRollup.type_comment, total)
+        .where(models.SentimentRollup.id_batch == batch_id)
+        .group_by(bucket, models.SentimentRollup.type_comment)
+        .having(total > 0)
         .order_by(bucket)
     )
     mapping = {0: "negative", 1: "neutral", 2: "positive"}
@@ -108,5 +397,184 @@ async def classified_sentiment_timeseries(
         label = mapping.get(type_value)
         if not label:
             continue
-        series[label].append({"date": ts.date().isoformat(), "value": int(count)})
+        series[label].append({"date": _bucket_date(ts), "value": int(count)})
+    return series
+
+
+def _source_filters(src: str | None, time_from: datetime | None, time_to: datetime | None) -> list:
+    """Rollup conditions matching `time_from <= time < time_to` of the row listings, widened to whole UTC days."""
+    sources = models.SourceSentimentRollup
+    conditions = []
+    if src is not None:
+        conditions.append(sources.src == src)
+    if time_from is not None:
+        conditions.append(sources.day >= rollups.day_of(time_from))
+    if time_to is not None:
+        # Day of the last instant before time_to; a partial last day is counted as a whole.
+        conditions.append(sources.day <= rollups.day_of(time_to - timedelta(microseconds=1)))
+    return conditions
+
+
+async def source_sentiment_share(
+    session: AsyncSession,
+    src: str | None,
+    time_from: datetime | None,
+    time_to: datetime | None,
+) -> tuple[dict[str, dict[str, int]], dict[str, int]]:
+    """Sentiment counts across all batches per src, plus their total."""
+    sources = models.SourceSentimentRollup
+    total = func.sum(sources.count)
+    result = await session.execute(
+        select(sources.src, sources.type_comment, total)
+        .where(*_source_filters(src, time_from, time_to))
+        .group_by(sources.src, sources.type_comment)
+        .having(total > 0)
+        .order_by(sources.src)
+    )
+    mapping = {0: "negative", 1: "neutral", 2: "positive"}
+    by_source: dict[str, dict[str, int]] = {}
+    overall = {name: 0 for name in mapping.values()}
+    for source, type_value, count in result.all():
+        label = mapping.get(type_value)
+        if not label:
+            continue
+        by_source.setdefault(source, {name: 0 for name in mapping.values()})[label] = int(count)
+        overall[label] += int(count)
+    return by_source, overall
+
+
+async def source_sentiment_timeseries(
+    session: AsyncSession,
+    granularity: str,
+    src: str | None,
+    time_from: datetime | None,
+    time_to: datetime | None,
+) -> dict[str, list[dict[str, str | int]]]:
+    """Sentiment time series across all batches, optionally for one src."""
+    if granularity not in {"day", "week", "month"}:
+        granularity = "month"
+    sources = models.SourceSentimentRollup
+    bucket = _rollup_bucket(granularity, sources.day)
+    total = func.sum(sources.count)
+    result = await session.execute(
+        select(bucket, sources.type_comment, total)
+        .where(*_source_filters(src, time_from, time_to))
+        .group_by(bucket, sources.type_comment)
+        .having(total > 0)
+        .order_by(bucket)
+    )
+    mapping = {0: "negative", 1: "neutral", 2: "positive"}
+    series: dict[str, list[dict[str, str | int]]] = {name: [] for name in mapping.values()}
+    for ts, type_value, count in result.all():
+        label = mapping.get(type_value)
+        if ts is None or not label:
+            continue
+        series[label].append({"date": _bucket_date(ts), "value": int(count)})
     return series
+
+
+async def dashboard_snapshot(
+    session: AsyncSession,
+    batch_id: uuid.UUID,
+    granularity: str,
+    feed_limit: int,
+) -> dict:
+    """Everything the dashboard shows for a batch, fetched with one SELECT.
+
+    Count, summary, per-bucket sentiment counts and the comment feed are scalar
+    subqueries of a single statement; share and both series are folded from the
+    bucket rows in Python. The feed is capped at `MAX_PAGE_SIZE` rows.
+    """
+    if granularity not in {"day", "week", "month"}:
+        granularity = "day"
+    feed_limit = min(feed_limit, MAX_PAGE_SIZE)
+    rollup = models.SentimentRollup
+    summary = models.BatchSummary
+    classified = models.ClassifiedComment
+
+    bucket = _rollup_bucket(granularity)
+    per_bucket = (
+        select(bucket, rollup.type_comment, func.sum(rollup.count).label("n"))
+        .where(rollup.id_batch == batch_id)
+        .group_by(bucket, rollup.type_comment)
+        .subquery()
+    )
+    feed = (
+        select(classified.id_comment, classified.comment_clean, classified.src, classified.time, classified.type_comment)
+        .where(classified.id_batch == batch_id)
+        .order_by(classified.id_comment)
+        .limit(feed_limit)
+        .subquery()
+    )
+    stmt = select(
+        select(func.count())
+        .select_from(models.RawComment)
+        .where(models.RawComment.id_batch == batch_id)
+        .scalar_subquery()
+        .label("total"),
+        select(
+            func.json_build_object(
+                "time", summary.time,
+                "f1_metric", summary.f1_metric,
+                "unique_ratio", summary.unique_ratio,
+                "dedup_bytes_saved", summary.dedup_bytes_saved,
+                "classified_count", summary.classified_count,
+                "metrics", summary.metrics,
+                type_=JSON,
+            )
+        )
+        .where(summary.id_batch == batch_id)
+        .scalar_subquery()
+        .label("summary"),
+        select(
+            func.json_agg(
+                aggregate_order_by(
+                    func.json_build_array(per_bucket.c.bucket, per_bucket.c.type_comment, per_bucket.c.n),
+                    per_bucket.c.bucket,
+                ),
+                type_=JSON,
+            )
+        )
+        .scalar_subquery()
+        .label("buckets"),
+        select(
+            func.json_agg(
+                aggregate_order_by(
+                    func.json_build_object(
+                        "id_comment", feed.c.id_comment,
+                        "comment_clean", feed.c.comment_clean,
+                        "src", feed.c.src,
+                        "time", feed.c.time,
+                        "type_comment", feed.c.type_comment,
+                    ),
+                    feed.c.id_comment,
+                ),
+                type_=JSON,
+            )
+        )
+        .scalar_subquery()
+        .label("feed"),
+    )
+    row = (await session.execute(stmt)).one()
+
+    mapping = {0: "negative", 1: "neutral", 2: "positive"}
+    share = {name: 0 for name in mapping.values()}
+    sentiment_series: dict[str, list[dict[str, str | int]]] = {name: [] for name in mapping.values()}
+    review_totals: dict[str, int] = {}
+    for ts, type_value, count in row.buckets or []:
+        label = mapping.get(type_value)
+        if ts is None or not label or not count:
+            continue
+        day = str(ts)[:10]
+        share[label] += int(count)
+        sentiment_series[label].append({"date": day, "value": int(count)})
+        review_totals[day] = review_totals.get(day, 0) + int(count)
+
+    return {
+        "total": int(row.total or 0),
+        "summary": {"id_batch": batch_id, **row.summary} if row.summary else None,
+        "share": share,
+        "series": [{"date": day, "value": value} for day, value in review_totals.items()],
+        "sentiment_series": sentiment_series,
+        "items": [{"id_batch": batch_id, **item} for item in row.feed or []],
+    }
@@ -0,0 +1,141 @@
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+from fastapi import Request, Response
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.config import get_settings
+
+settings = get_settings()
+
+
+class TTLCache:
+    """LRU mapping whose entries also expire `ttl` seconds after they were stored."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        stored_at, value = item
+        if time.monotonic() - stored_at > self.ttl:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+def _etag(endpoint: str, batch_id: uuid.UUID, params: tuple, version: int) -> str:
+    digest = hashlib.sha1(f"{endpoint}|{batch_id}|{params!r}|{version}".encode("utf-8")).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def _if_none_match(request: Request) -> set[str]:
+    header = request.headers.get("if-none-match", "")
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+
+class ResponseCache:
+    """Read-through cache of batch reporting responses.
+
+    Entries are keyed by endpoint, batch and query parameters and tagged with
+    `BatchSummary.version`, which every writer of classified data bumps; a
+    bump makes all cached responses and ETags of the batch stale at once. The
+    last seen version of a batch is trusted for `version_ttl` seconds, so a
+    matching `If-None-Match` is answered with 304 without a database query.
+    Versions bumped by another process are picked up after that interval.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, version_ttl: float):
+        self.responses = TTLCache(max_entries, ttl)
+        self.versions = TTLCache(max_entries, version_ttl)
+
+    async def version(self, session: AsyncSession, batch_id: uuid.UUID) -> int:
+        known = self.versions.get(batch_id)
+        if known is None:
+            known = await session.scalar(
+                select(models.BatchSummary.version).where(models.BatchSummary.id_batch == batch_id)
+            ) or 0
+            self.versions.put(batch_id, known)
+        return known
+
+    def forget(self, batch_id: uuid.UUID) -> None:
+        self.versions.pop(batch_id)
+
+    async def respond(
+        self,
+        request: Request,
+        response: Response,
+        session: AsyncSession,
+        endpoint: str,
+        batch_id: uuid.UUID,
+        params: tuple,
+        loader: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Return the cached payload (or a 304) for the current batch version, loading it on a miss."""
+        version = await self.version(session, batch_id)
+        etag = _etag(endpoint, batch_id, params, version)
+        if etag in _if_none_match(request):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        key = (endpoint, batch_id, params)
+        cached = self.responses.get(key)
+        if cached is not None and cached[0] == version:
+            payload = cached[1]
+        else:
+            payload = await loader()
+            self.responses.put(key, (version, payload))
+        response.headers["ETag"] = etag
+        # Let browsers keep the body but revalidate it on every request.
+        response.headers["Cache-Control"] = "no-cache"
+        return payload
+
+
+async def bump_version(session: AsyncSession, batch_id: uuid.UUID) -> None:
+    """Invalidate cached reporting responses of the batch once the session commits."""
+    await session.execute(
+        update(models.BatchSummary)
+        .where(models.BatchSummary.id_batch == batch_id)
+        .values(version=models.BatchSummary.version + 1)
+    )
+    get_response_cache().forget(batch_id)
+
+
+_cache: ResponseCache | None = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache(
+            settings.response_cache_size,
+            settings.response_cache_ttl,
+            settings.response_cache_version_ttl,
+        )
+    return _cache
@@ -0,0 +1,150 @@
+import uuid
+from collections import Counter
+from datetime import date, datetime, timezone
+from typing import Iterable, Mapping
+
+from sqlalchemy import Date, cast, delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app import models
+from app.services import bulk
+
+# (UTC day, type_comment, src) -> row count delta
+RollupKey = tuple[date, int, str]
+
+
+def day_of(ts: datetime | None) -> date:
+    if ts is None:
+        return datetime.now(timezone.utc).date()
+    ts = ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc).date()
+
+
+def count_rows(rows: Iterable[tuple[datetime | None, str | None, int]]) -> Counter[RollupKey]:
+    """Aggregate (time, src, type_comment) tuples into rollup deltas."""
+    return Counter((day_of(ts), int(label), src or "") for ts, src, label in rows)
+
+
+def _day_expr(column):
+    # Same UTC day as day_of(), whatever the session time zone is.
+    return cast(func.timezone("UTC", column), Date)
+
+
+async def _apply_sources(session: AsyncSession, deltas: Mapping[RollupKey, int]) -> None:
+    # Every batch writes to the same rows; a fixed key order keeps concurrent runs from deadlocking.
+    rows = [
+        {"src": src, "day": day, "type_comment": label, "count": delta}
+        for (day, label, src), delta in sorted(deltas.items())
+        if delta
+    ]
+    if not rows:
+        return
+    table = models.SourceSentimentRollup.__table__
+    stmt = await bulk.upsert_insert(session, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.src, table.c.day, table.c.type_comment],
+        set_={"count": table.c.count + stmt.excluded.count},
+    )
+    for start in range(0, len(rows), bulk.INSERT_BATCH_SIZE):
+        await session.execute(stmt, rows[start:start + bulk.INSERT_BATCH_SIZE])
+
+
+async def apply(session: AsyncSession, batch_id: uuid.UUID, deltas: Mapping[RollupKey, int]) -> None:
+    """Add signed deltas to the batch rollup and the cross-batch rollup in the session's transaction."""
+    # Sorted like _apply_sources: a relabel 0->2 and a concurrent 2->0 must lock rows in the same order.
+    rows = [
+        {"id_batch": batch_id, "day": day, "type_comment": label, "src": src, "count": delta}
+        for (day, label, src), delta in sorted(deltas.items())
+        if delta
+    ]
+    if not rows:
+        return
+    table = models.SentimentRollup.__table__
+    stmt = await bulk.upsert_insert(session, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.id_batch, table.c.day, table.c.type_comment, table.c.src],
+        set_={"count": table.c.count + stmt.excluded.count},
+    )
+    for start in range(0, len(rows), bulk.INSERT_BATCH_SIZE):
+        await session.execute(stmt, rows[start:start + bulk.INSERT_BATCH_SIZE])
+    await _apply_sources(session, deltas)
+
+
+def relabel_deltas(changes: Iterable[tuple[datetime | None, str | None, int, int]]) -> Counter[RollupKey]:
+    """Deltas for (time, src, old label, new label) edits."""
+    deltas: Counter[RollupKey] = Counter()
+    for ts, src, old, new in changes:
+        if old == new:
+            continue
+        deltas[(day_of(ts), int(old), src or "")] -= 1
+        deltas[(day_of(ts), int(new), src or "")] += 1
+    return deltas
+
+
+async def _batch_deltas(session: AsyncSession, batch_id: uuid.UUID, sign: int) -> Counter[RollupKey]:
+    result = await session.execute(
+        select(
+            models.SentimentRollup.day,
+            models.SentimentRollup.type_comment,
+            models.SentimentRollup.src,
+            models.SentimentRollup.count,
+        ).where(models.SentimentRollup.id_batch == batch_id)
+    )
+    return Counter({(day, label, src): sign * count for day, label, src, count in result.all()})
+
+
+async def clear_batch(session: AsyncSession, batch_id: uuid.UUID) -> None:
+    """Remove the batch rollup and take its counts out of the cross-batch rollup."""
+    await _apply_sources(session, await _batch_deltas(session, batch_id, -1))
+    await session.execute(delete(models.SentimentRollup).where(models.SentimentRollup.id_batch == batch_id))
+
+
+async def rebuild_batch(session: AsyncSession, batch_id: uuid.UUID) -> None:
+    """Recompute the batch rollup from classified_comments (after bulk deletes)."""
+    classified = models.ClassifiedComment
+    day = _day_expr(classified.time)
+    src = func.coalesce(classified.src, "")
+    await clear_batch(session, batch_id)
+    await session.execute(
+        insert(models.SentimentRollup).from_select(
+            ["id_batch", "day", "type_comment", "src", "count"],
+            select(classified.id_batch, day, classified.type_comment, src, func.count())
+            .where(classified.id_batch == batch_id)
+            .group_by(classified.id_batch, day, classified.type_comment, src),
+        )
+    )
+    await _apply_sources(session, await _batch_deltas(session, batch_id, 1))
+
+
+async def backfill_batches(conn: AsyncConnection) -> None:
+    """Fill an empty batch rollup from classified_comments (databases created before rollups)."""
+    if await conn.scalar(select(models.SentimentRollup.id_batch).limit(1)) is not None:
+        return
+    classified = models.ClassifiedComment
+    day = _day_expr(classified.time)
+    src = func.coalesce(classified.src, "")
+    await conn.execute(
+        insert(models.SentimentRollup).from_select(
+            ["id_batch", "day", "type_comment", "src", "count"],
+            select(classified.id_batch, day, classified.type_comment, src, func.count())
+            .group_by(classified.id_batch, day, classified.type_comment, src),
+        )
+    )
+
+
+async def backfill_sources(conn: AsyncConnection) -> None:
+    """Fill an empty cross-batch rollup from the batch rollups (first start after upgrading).
+
+    Check and insert are not atomic; init_models runs this under its advisory lock.
+    """
+    sources = models.SourceSentimentRollup
+    if await conn.scalar(select(sources.src).limit(1)) is not None:
+        return
+    rollup = models.SentimentRollup
+    await conn.execute(
+        insert(sources).from_select(
+            ["src", "day", "type_comment", "count"],
+            select(rollup.src, rollup.day, rollup.type_comment, func.sum(rollup.count))
+            .group_by(rollup.src, rollup.day, rollup.type_comment),
+        )
+    )
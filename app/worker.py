@@ -0,0 +1,46 @@
+import asyncio
+import logging
+import os
+import signal
+import socket
+
+from app.config import get_settings
+from app.create_tables import init_models
+from app.db import AsyncSessionLocal, engine
+from app.services import jobs
+from app.services.model_client import close_model_client
+
+settings = get_settings()
+logger = logging.getLogger("app.worker")
+
+
+async def main() -> None:
+    """Drain the job queue until SIGINT/SIGTERM; run one process per core or node."""
+    await init_models()
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info("Worker %s started", worker)
+    try:
+        while not stop.is_set():
+            async with AsyncSessionLocal() as session:
+                job = await jobs.claim(session, worker)
+            if job is None:
+                try:
+                    await asyncio.wait_for(stop.wait(), settings.job_poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            logger.info("Job %s claimed for batch %s", job.id_job, job.id_batch)
+            await jobs.run(job)
+    finally:
+        await close_model_client()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""Compare ORM add_all against bulk.copy_rows for classified_comments.
+
+Usage (against the database from DATABASE_URL):
+
+    python -m benchmarks.bulk_write --rows 200000
+
+Rows are written under throwaway batch ids and deleted afterwards.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import delete
+
+from app import models
+from app.db import AsyncSessionLocal, Base, engine
+from app.services import bulk
+from app.services.pipeline import CLASSIFIED_COLUMNS
+
+
+def _rows(batch_id: uuid.UUID, count: int) -> list[tuple]:
+    now = datetime.now(timezone.utc)
+    return [(i, batch_id, f"отзыв номер {i}", "bench", now, i % 3, "bench") for i in range(1, count + 1)]
+
+
+async def _orm(rows: list[tuple]) -> float:
+    async with AsyncSessionLocal() as session:
+        started = time.perf_counter()
+        session.add_all(models.ClassifiedComment(**dict(zip(CLASSIFIED_COLUMNS, row))) for row in rows)
+        await session.commit()
+        return time.perf_counter() - started
+
+
+async def _copy(rows: list[tuple]) -> float:
+    async with AsyncSessionLocal() as session:
+        started = time.perf_counter()
+        await bulk.copy_rows(session, models.ClassifiedComment.__table__, CLASSIFIED_COLUMNS, rows)
+        await session.commit()
+        return time.perf_counter() - started
+
+
+async def main(count: int) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    batches = {"orm add_all": uuid.uuid4(), "copy_rows": uuid.uuid4()}
+    runners = {"orm add_all": _orm, "copy_rows": _copy}
+    try:
+        for name, batch_id in batches.items():
+            elapsed = await runners[name](_rows(batch_id, count))
+            print(f"{name:>12}: {count} rows in {elapsed:.2f}s ({count / elapsed:,.0f} rows/s)")
+    finally:
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                delete(models.ClassifiedComment).where(models.ClassifiedComment.id_batch.in_(batches.values()))
+            )
+            await session.commit()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    asyncio.run(main(parser.parse_args().rows))
@@ -0,0 +1,75 @@
+"""Compare the /dashboard snapshot with the per-widget calls the frontend makes.
+
+Usage (needs a running API with a processed batch):
+
+    python -m benchmarks.dashboard --file-id <uuid> --runs 50
+
+The fan-out side issues the six GET requests concurrently, as the dashboard
+page does; the snapshot side issues a single /dashboard request.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+_FAN_OUT = (
+    "/batch_count?file_id={file_id}",
+    "/batch_summary?file_id={file_id}",
+    "/sentiment_share?file_id={file_id}",
+    "/sentiment_series?file_id={file_id}&granularity={granularity}",
+    "/review_series?file_id={file_id}&granularity={granularity}",
+    "/classified?file_id={file_id}&limit={limit}",
+)
+_SNAPSHOT = "/dashboard?file_id={file_id}&granularity={granularity}&limit={limit}"
+
+
+async def _fan_out(client: httpx.AsyncClient, params: dict) -> None:
+    responses = await asyncio.gather(*(client.get(path.format(**params)) for path in _FAN_OUT))
+    for resp in responses:
+        # batch_summary answers 404 until the batch has been classified.
+        if resp.status_code not in (200, 404):
+            resp.raise_for_status()
+
+
+async def _snapshot(client: httpx.AsyncClient, params: dict) -> None:
+    resp = await client.get(_SNAPSHOT.format(**params))
+    resp.raise_for_status()
+
+
+async def _measure(fn, client: httpx.AsyncClient, params: dict, runs: int) -> list[float]:
+    await fn(client, params)  # warm-up
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await fn(client, params)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def _report(name: str, timings: list[float]) -> None:
+    ordered = sorted(timings)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    print(f"{name}: median {statistics.median(timings) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms")
+
+
+async def main(api_url: str, file_id: str, granularity: str, limit: int, runs: int) -> None:
+    params = {"file_id": file_id, "granularity": granularity, "limit": limit}
+    async with httpx.AsyncClient(base_url=api_url.rstrip("/"), timeout=60.0) as client:
+        fan_out = await _measure(_fan_out, client, params, runs)
+        snapshot = await _measure(_snapshot, client, params, runs)
+    _report(f"fan-out ({len(_FAN_OUT)} requests)", fan_out)
+    _report("snapshot (/dashboard)", snapshot)
+    print(f"speed-up: {statistics.median(fan_out) / statistics.median(snapshot):.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api-url", default="http://localhost:8000")
+    parser.add_argument("--file-id", required=True)
+    parser.add_argument("--granularity", default="day", choices=("day", "week", "month"))
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.api_url, args.file_id, args.granularity, args.limit, args.runs))
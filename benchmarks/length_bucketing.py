@@ -0,0 +1,59 @@
+"""Compare fixed-size and length-bucketed batching in SentimentModel.predict.
+
+Usage (needs torch, transformers and the sentiment_model directory):
+
+    python -m benchmarks.length_bucketing --texts 5000
+
+Texts follow a long-tailed length distribution typical for reviews: most are
+a few words, a small share are long paragraphs.
+"""
+import argparse
+import random
+import time
+
+from implementation import SentimentModel
+
+_WORDS = (
+    "доставка быстро товар качество цена спасибо отлично плохо размер упаковка "
+    "курьер магазин заказ вернули деньги рекомендую брак пришёл вовремя ок"
+).split()
+
+
+def _sample_texts(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        words = max(1, min(400, int(rng.lognormvariate(1.8, 1.1))))
+        texts.append(" ".join(rng.choice(_WORDS) for _ in range(words)))
+    return texts
+
+
+def _timed(model: SentimentModel, texts: list[str]) -> tuple[float, list[int]]:
+    started = time.perf_counter()
+    labels = model.predict(texts)
+    return time.perf_counter() - started, labels
+
+
+def main(count: int, max_batch_tokens: int, seed: int) -> None:
+    texts = _sample_texts(count, seed)
+    model = SentimentModel(max_batch_tokens=max_batch_tokens)
+    model.predict(texts[:64])  # warm-up
+
+    model.length_bucketing = False
+    fixed_time, fixed_labels = _timed(model, texts)
+    model.length_bucketing = True
+    bucketed_time, bucketed_labels = _timed(model, texts)
+
+    agreement = sum(a == b for a, b in zip(fixed_labels, bucketed_labels)) / len(texts)
+    print(f"fixed batches ({model.batch_size} rows): {fixed_time:.2f}s ({count / fixed_time:,.0f} texts/s)")
+    print(f"length-bucketed ({model.max_batch_tokens} tokens): {bucketed_time:.2f}s ({count / bucketed_time:,.0f} texts/s)")
+    print(f"speed-up: {fixed_time / bucketed_time:.2f}x, label agreement: {agreement:.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--max-batch-tokens", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+    main(args.texts, args.max_batch_tokens, args.seed)
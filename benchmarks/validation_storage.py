@@ -0,0 +1,83 @@
+"""Compare the old full-copy validation table with the slim comment_validation shape.
+
+Usage (against the Postgres database from DATABASE_URL):
+
+    python -m benchmarks.validation_storage --rows 200000 --reviewed 0.01
+
+The old shape wrote every classified row again, text included; the slim table
+only holds keys and review state for the reviewed share of rows. Both are
+written into scratch tables that are dropped afterwards.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import Boolean, Column, DateTime, Integer, MetaData, String, Table, text
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.db import AsyncSessionLocal, engine
+from app.services import bulk
+
+_metadata = MetaData()
+_FULL = Table(
+    "bench_validation_full",
+    _metadata,
+    Column("id_comment", Integer, primary_key=True),
+    Column("id_batch", UUID(as_uuid=True), primary_key=True, index=True),
+    Column("comment_clean", String, nullable=False),
+    Column("src", String),
+    Column("time", DateTime(timezone=True), nullable=False),
+    Column("type_comment", Integer, nullable=False),
+    Column("validation", Boolean, nullable=False),
+)
+_SLIM = Table(
+    "bench_validation_slim",
+    _metadata,
+    Column("id_comment", Integer, primary_key=True),
+    Column("id_batch", UUID(as_uuid=True), primary_key=True),
+    Column("validated", Boolean, nullable=False),
+    Column("corrected_label", Integer),
+)
+
+
+async def _write(table: Table, columns: tuple[str, ...], rows: list[tuple]) -> tuple[float, int]:
+    async with AsyncSessionLocal() as session:
+        started = time.perf_counter()
+        await bulk.copy_rows(session, table, columns, rows)
+        await session.commit()
+        elapsed = time.perf_counter() - started
+        size = await session.scalar(text("SELECT pg_total_relation_size(:name)"), {"name": table.name})
+    return elapsed, int(size)
+
+
+async def main(count: int, reviewed: float) -> None:
+    batch_id = uuid.uuid4()
+    now = datetime.now(timezone.utc)
+    text_sample = "доставка быстрая, товар соответствует описанию, рекомендую продавца"
+    full_rows = [(i, batch_id, f"{text_sample} {i}", "bench", now, i % 3, False) for i in range(1, count + 1)]
+    step = max(1, round(1 / reviewed)) if reviewed > 0 else count + 1
+    slim_rows = [(i, batch_id, True, (i + 1) % 3) for i in range(1, count + 1, step)]
+
+    async with engine.begin() as conn:
+        await conn.run_sync(_metadata.create_all)
+    try:
+        full_time, full_size = await _write(_FULL, tuple(c.name for c in _FULL.columns), full_rows)
+        slim_time, slim_size = await _write(_SLIM, tuple(c.name for c in _SLIM.columns), slim_rows)
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(_metadata.drop_all)
+        await engine.dispose()
+
+    print(f"full copy: {len(full_rows)} rows in {full_time:.2f}s, {full_size / 2**20:.1f} MiB")
+    print(f"slim side table: {len(slim_rows)} rows in {slim_time:.2f}s, {slim_size / 2**20:.1f} MiB")
+    print(f"saved per batch: {full_time - slim_time:.2f}s of writes, {(full_size - slim_size) / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--reviewed", type=float, default=0.01, help="share of rows with a manual review")
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.reviewed))
@@ -1,16 +1,36 @@
 from __future__ import annotations
 
+import argparse
+import csv
+import inspect
+import time
 from pathlib import Path
 from typing import Iterable, List
 
+import numpy as np
 import torch
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
 
+# "torch": eager fp32; "torch-int8": dynamic int8 quantization of Linear layers
+# (CPU only); "onnx": ONNX Runtime session over `<model_dir>/model.onnx`.
+BACKENDS = ("torch", "torch-int8", "onnx")
+ONNX_FILENAME = "model.onnx"
+
 
 class SentimentModel:
     """Wrapper around a local Transformers classifier."""
 
-    def __init__(self, model_dir: str | Path | None = None, max_length: int = 256, batch_size: int = 32):
+    def __init__(
+        self,
+        model_dir: str | Path | None = None,
+        max_length: int = 256,
+        batch_size: int = 32,
+        length_bucketing: bool = False,
+        max_batch_tokens: int = 4096,
+        backend: str = "torch",
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}'. Expected one of: {', '.join(BACKENDS)}.")
         base_path = Path(__file__).parent
         self.model_path = Path(model_dir) if model_dir else base_path / "sentiment_model"
         if not self.model_path.exists():
@@ -18,16 +38,71 @@ class SentimentModel:
 
         self.max_length = max_length
         self.batch_size = batch_size
+        # Length-aware mode: sort by token length and fill batches up to a
+        # padded-token budget (rows x longest row) instead of a fixed row count.
+        self.length_bucketing = length_bucketing
+        self.max_batch_tokens = max(max_batch_tokens, max_length)
+        self.backend = backend
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
-        self.model = AutoModelForSequenceClassification.from_pretrained(self.model_path)
 
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        if backend == "onnx":
+            self.model = None
+            self.session = _load_onnx_session(self.model_path / ONNX_FILENAME)
+            self.device = torch.device("cpu")
+            return
+
+        self.session = None
+        self.model = AutoModelForSequenceClassification.from_pretrained(self.model_path)
+        if backend == "torch-int8":
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            device = torch.device("cpu")
+        else:
+            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.device = device
         self.model.to(self.device)
         self.model.eval()
 
+    def _forward(self, inputs: dict) -> List[int]:
+        if self.session is not None:
+            names = {item.name for item in self.session.get_inputs()}
+            feed = {k: v.cpu().numpy() for k, v in inputs.items() if k in names}
+            logits = self.session.run(None, feed)[0]
+            return [int(p) for p in logits.argmax(axis=-1).tolist()]
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        with torch.no_grad():
+            logits = self.model(**inputs).logits
+            return [int(p) for p in torch.argmax(logits, dim=-1).cpu().tolist()]
+
+    def _predict_bucketed(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        encodings = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+        lengths = [len(ids) for ids in encodings["input_ids"]]
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+        labels: List[int] = [0] * len(texts)
+
+        def _flush(batch: List[int]) -> None:
+            features = [{key: encodings[key][idx] for key in encodings.keys()} for idx in batch]
+            inputs = self.tokenizer.pad(features, padding=True, return_tensors="pt")
+            for idx, label in zip(batch, self._forward(inputs)):
+                labels[idx] = label
+
+        batch: List[int] = []
+        for idx in order:
+            # Ascending order: the incoming text is the longest one in the batch.
+            if batch and (len(batch) + 1) * lengths[idx] > self.max_batch_tokens:
+                _flush(batch)
+                batch = []
+            batch.append(idx)
+        if batch:
+            _flush(batch)
+        return labels
+
     def predict(self, texts: Iterable[str]) -> List[int]:
         """Return predicted class ids for provided texts."""
+        if self.length_bucketing:
+            return self._predict_bucketed([text or "" for text in texts])
+
         batched_labels: List[int] = []
         buffer: List[str] = []
 
@@ -41,11 +116,7 @@ class SentimentModel:
                 max_length=self.max_length,
                 return_tensors="pt",
             )
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            with torch.no_grad():
-                logits = self.model(**inputs).logits
-                preds = torch.argmax(logits, dim=-1).cpu().tolist()
-                batched_labels.extend(int(p) for p in preds)
+            batched_labels.extend(self._forward(inputs))
 
         for text in texts:
             buffer.append(text or "")
@@ -57,3 +128,108 @@ class SentimentModel:
             _flush(buffer)
 
         return batched_labels
+
+
+def _load_onnx_session(path: Path):
+    try:
+        import onnxruntime as ort
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError("The 'onnx' backend requires the onnxruntime package.") from exc
+    if not path.exists():
+        raise FileNotFoundError(f"ONNX model '{path}' not found. Run `python implementation.py export` first.")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+
+
+def export_onnx(model_dir: str | Path | None = None, output: str | Path | None = None, opset: int = 17) -> Path:
+    """Export the fp32 classifier to ONNX with dynamic batch and sequence axes.
+
+    The exported graph is run once on a padded sample and compared with eager
+    logits when onnxruntime is installed.
+    """
+    fp32 = SentimentModel(model_dir=model_dir)
+    target = Path(output) if output else fp32.model_path / ONNX_FILENAME
+    sample = fp32.tokenizer(["пример отзыва", "ок"], padding=True, return_tensors="pt")
+    model = fp32.model.to("cpu")
+    # The exporter binds the dict to forward() in signature order (input_ids,
+    # attention_mask, token_type_ids for BERT), not in tokenizer key order.
+    names = [name for name in inspect.signature(model.forward).parameters if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in names}
+    dynamic_axes["logits"] = {0: "batch"}
+    with torch.no_grad():
+        expected = model(**sample).logits.numpy()
+        torch.onnx.export(
+            model,
+            (dict(sample),),
+            str(target),
+            input_names=names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    try:
+        session = _load_onnx_session(target)
+    except RuntimeError:  # pragma: no cover - onnxruntime not installed
+        return target
+    actual = session.run(None, {name: sample[name].numpy() for name in names})[0]
+    if not np.allclose(actual, expected, atol=1e-3):
+        raise RuntimeError(f"Exported ONNX model disagrees with fp32 logits (max diff {abs(actual - expected).max():.4f}).")
+    return target
+
+
+def _read_texts(path: str | Path) -> List[str]:
+    path = Path(path)
+    with path.open(encoding="utf-8", newline="") as fp:
+        if path.suffix.lower() != ".csv":
+            return [line.rstrip("\n") for line in fp if line.strip()]
+        rows = csv.DictReader(fp)
+        return [row.get("comment") or row.get("comment_clean") or row.get("text") or "" for row in rows]
+
+
+def parity_check(texts: List[str], backend: str, model_dir: str | Path | None = None) -> dict[str, int | float]:
+    """Compare `backend` against eager fp32 on `texts`: label agreement and timings."""
+    reference = SentimentModel(model_dir=model_dir)
+    candidate = SentimentModel(model_dir=model_dir, backend=backend)
+
+    started = time.perf_counter()
+    expected = reference.predict(texts)
+    reference_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    actual = candidate.predict(texts)
+    candidate_seconds = time.perf_counter() - started
+
+    agreement = sum(a == b for a, b in zip(expected, actual)) / len(texts) if texts else 1.0
+    return {
+        "texts": len(texts),
+        "agreement": agreement,
+        "fp32_seconds": reference_seconds,
+        f"{backend}_seconds": candidate_seconds,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SentimentModel backend tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Export sentiment_model to ONNX.")
+    export.add_argument("--model-dir")
+    export.add_argument("--output")
+    export.add_argument("--opset", type=int, default=17)
+
+    parity = sub.add_parser("parity", help="Report label agreement of a backend with fp32.")
+    parity.add_argument("texts", help="Text file (one text per line) or CSV with a comment/text column.")
+    parity.add_argument("--backend", choices=[b for b in BACKENDS if b != "torch"], default="onnx")
+    parity.add_argument("--model-dir")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        print(f"Exported to {export_onnx(args.model_dir, args.output, args.opset)}")
+    else:
+        report = parity_check(_read_texts(args.texts), args.backend, args.model_dir)
+        for key, value in report.items():
+            print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import gc
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import torch
+
+from implementation import ONNX_FILENAME, SentimentModel, _load_onnx_session
+
+# Set in the parent before the workers are forked; every worker inherits the
+# same object and reads the weights from pages shared copy-on-write.
+_model: SentimentModel | None = None
+
+
+def _init_worker(num_threads: int) -> None:
+    torch.set_num_threads(num_threads)
+    if _model is not None and _model.session is not None:
+        # ONNX Runtime sessions own native thread pools that do not survive fork.
+        _model.session = _load_onnx_session(_model.model_path / ONNX_FILENAME)
+
+
+def predict(texts: List[str]) -> List[int]:
+    """Run inference in a worker process on the inherited model."""
+    return _model.predict(texts)
+
+
+def _ping(_: int) -> int:
+    return os.getpid()
+
+
+class ModelWorkerPool:
+    """Forked inference processes sharing one loaded SentimentModel.
+
+    The model is loaded once in the parent; `fork` gives each worker the same
+    weight pages copy-on-write, so memory does not grow with the number of
+    workers. Each worker gets its own intra-op thread count.
+    """
+
+    def __init__(self, model: SentimentModel, workers: int, threads_per_worker: int | None = None):
+        global _model
+        _model = model
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        # Keep the collector from touching (and thus copying) inherited objects in the workers.
+        gc.freeze()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=mp.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker,),
+        )
+
+    def warm_up(self) -> set[int]:
+        """Start all worker processes now instead of on the first request."""
+        return set(self.executor.map(_ping, range(self.workers)))
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
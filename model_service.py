@@ -1,3 +1,8 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, List
+
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 
@@ -5,7 +10,135 @@ from implementation import SentimentModel
 
 
 app = FastAPI(title="Sentiment Model Service", version="1.0.0")
-model = SentimentModel()
+model = SentimentModel(
+    length_bucketing=os.getenv("MODEL_LENGTH_BUCKETING", "0").lower() in {"1", "true", "yes"},
+    max_batch_tokens=int(os.getenv("MODEL_MAX_BATCH_TOKENS", "4096")),
+    backend=os.getenv("MODEL_BACKEND", "torch"),
+)
+
+# Coalescing window: a batch is dispatched once it holds this many texts or the
+# oldest queued request has waited MODEL_MAX_WAIT_MS.
+MAX_BATCH_TEXTS = int(os.getenv("MODEL_MAX_BATCH_TEXTS", "0")) or model.batch_size
+MAX_WAIT_MS = float(os.getenv("MODEL_MAX_WAIT_MS", "10"))
+# MODEL_WORKERS > 1 forks that many inference processes sharing the loaded weights.
+MODEL_WORKERS = int(os.getenv("MODEL_WORKERS", "1"))
+MODEL_THREADS_PER_WORKER = int(os.getenv("MODEL_THREADS_PER_WORKER", "0")) or None
+
+
+class MicroBatcher:
+    """Queue texts from concurrent requests and run them as shared batches.
+
+    Inference runs on `executor` (a dedicated thread by default) so the event
+    loop keeps accepting requests while a batch is being computed. Up to
+    `max_in_flight` batches run at once, one per inference worker; results are
+    sliced back to each caller in submission order.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[List[str]], List[int]],
+        max_batch_texts: int,
+        max_wait: float,
+        executor: Executor | None = None,
+        max_in_flight: int = 1,
+    ):
+        self.predict_fn = predict_fn
+        self.max_batch_texts = max(1, max_batch_texts)
+        self.max_wait = max_wait
+        self.max_in_flight = max(1, max_in_flight)
+        self._queue: asyncio.Queue[tuple[List[str], asyncio.Future]] | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._worker: asyncio.Task | None = None
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError("Model service is shutting down."))
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, texts: List[str]) -> List[int]:
+        if self._queue is None:
+            raise RuntimeError("MicroBatcher is not started.")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, future))
+        return await future
+
+    async def _collect(self) -> list[tuple[List[str], asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        items = [await self._queue.get()]
+        size = len(items[0][0])
+        deadline = loop.time() + self.max_wait
+        while size < self.max_batch_texts:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            items.append(item)
+            size += len(item[0])
+        return items
+
+    async def _run(self) -> None:
+        while True:
+            # Wait for a free worker first, so the queue keeps filling the next batch meanwhile.
+            await self._slots.acquire()
+            try:
+                items = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._dispatch(items))
+            task.add_done_callback(lambda _: self._slots.release())
+
+    async def _dispatch(self, items: list[tuple[List[str], asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        texts = [text for item_texts, _ in items for text in item_texts]
+        try:
+            labels = await loop.run_in_executor(self._executor, self.predict_fn, texts)
+        except Exception as exc:  # pragma: no cover - defensive
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        offset = 0
+        for item_texts, future in items:
+            # A caller may have gone away (client disconnect cancels its future).
+            if not future.done():
+                future.set_result(labels[offset:offset + len(item_texts)])
+            offset += len(item_texts)
+
+
+if MODEL_WORKERS > 1:
+    import model_pool
+
+    pool = model_pool.ModelWorkerPool(model, MODEL_WORKERS, MODEL_THREADS_PER_WORKER)
+    batcher = MicroBatcher(
+        model_pool.predict,
+        MAX_BATCH_TEXTS,
+        MAX_WAIT_MS / 1000,
+        executor=pool.executor,
+        max_in_flight=pool.workers,
+    )
+else:
+    pool = None
+    batcher = MicroBatcher(model.predict, MAX_BATCH_TEXTS, MAX_WAIT_MS / 1000)
 
 
 class PredictRequest(BaseModel):
@@ -16,6 +149,20 @@ class PredictResponse(BaseModel):
     labels: list[int]
 
 
+@app.on_event("startup")
+async def startup_event() -> None:
+    if pool is not None:
+        await asyncio.get_running_loop().run_in_executor(None, pool.warm_up)
+    await batcher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    await batcher.stop()
+    if pool is not None:
+        pool.shutdown()
+
+
 @app.get("/health")
 async def health() -> dict[str, str]:
     return {"status": "ok"}
@@ -26,7 +173,7 @@ async def predict(request: PredictRequest) -> PredictResponse:
     if not request.texts:
         return PredictResponse(labels=[])
     try:
-        labels = model.predict(request.texts)
+        labels = await batcher.submit(request.texts)
     except Exception as exc:  # pragma: no cover - defensive
         raise HTTPException(status_code=500, detail=f"Inference failed: {exc}") from exc
     return PredictResponse(labels=[int(label) for label in labels])
@@ -13,6 +13,7 @@ import {
   ReviewSeriesResponse,
   SentimentSeriesResponse,
   Granularity,
+  JobApiResponse,
 } from "../types";
 
 const API_BASE = (import.meta as any).env?.VITE_API_BASE_URL || "http://localhost:8000";
@@ -104,9 +105,26 @@ export async function uploadCsv(file: File): Promise<UploadResponse> {
   if (data.status === "success" && !data.fileId && (data as any).file_id) {
     data.fileId = (data as any).file_id;
   }
+  if (data.status === "success" && data.job_id) {
+    await waitForJob(data.job_id);
+  }
   return data;
 }
 
+export async function waitForJob(jobId: string, intervalMs = 1500): Promise<void> {
+  // Uploads are processed by the background worker; poll until the job settles.
+  for (;;) {
+    const res = await fetch(`${API_BASE}/jobs/${encodeURIComponent(jobId)}`);
+    const data = await handleJson<JobApiResponse>(res);
+    const status = data.job?.status;
+    if (status === "done") return;
+    if (status === "failed") {
+      throw new Error(data.job?.error || "Processing failed.");
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+}
+
 export async function fetchClassified(fileId: string, limit = 50): Promise<Comment[]> {
   if (!fileId) throw new Error("file_id is required.");
   const res = await fetch(`${API_BASE}/classified?file_id=${encodeURIComponent(fileId)}&limit=${limit}`);
@@ -48,6 +48,22 @@ export interface UploadResponse {
   invalidRows?: number[];
   file_id?: string;
   fileId?: string;
+  job_id?: string;
+}
+
+export interface JobApiResponse {
+  status: "success" | "error";
+  job?: {
+    id_job: string;
+    id_batch: string;
+    status: "queued" | "running" | "done" | "failed";
+    stage: string;
+    rows_cleaned: number;
+    rows_classified: number;
+    error?: string | null;
+  };
+  timings?: Record<string, number>;
+  message?: string;
 }
 
 export interface PatchScoreBody {